@@ -1,12 +1,30 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from sqlalchemy.orm import joinedload
 from app import db, bcrypt
 from models import Admin, User, Transaction, Referral
 from utils import format_currency
+from ledger import post_transfers, reject_transfers
+from scheduler import start_approved_standing_orders
+from outbox import record_completed
+from db_routing import read_replica
 from datetime import datetime, timedelta
 import logging
 
 admin_bp = Blueprint('admin', __name__)
 
+REVIEW_PAGE_SIZES = (20, 50, 100)
+
+def flagged_transactions_query():
+    """Pending transactions held for admin review, riskiest and oldest first.
+
+    Only transfers flagged at creation are included; other pending transfers
+    are waiting for their sender's OTP and must not be approved here.
+    """
+    return Transaction.query.filter(
+        Transaction.status == 'pending',
+        Transaction.is_flagged.is_(True)
+    ).order_by(Transaction.risk_score.desc(), Transaction.created_at.asc())
+
 def require_admin(f):
     """Decorator to require admin login"""
     def decorated_function(*args, **kwargs):
@@ -26,6 +44,7 @@ def login():
         admin = Admin.query.filter_by(username=username).first()
         
         if admin and password and bcrypt.check_password_hash(admin.password_hash, password):
+            session.regenerate()
             session['admin_id'] = admin.id
             admin.last_login = datetime.utcnow()
             db.session.commit()
@@ -45,6 +64,7 @@ def logout():
 
 @admin_bp.route('/dashboard')
 @require_admin
+@read_replica
 def dashboard():
     # Get key metrics
     total_users = User.query.count()
@@ -57,11 +77,10 @@ def dashboard():
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
     recent_transactions = Transaction.query.order_by(Transaction.created_at.desc()).limit(10).all()
     
-    # Suspicious activity
-    suspicious_transactions = Transaction.query.filter(
-        Transaction.status == 'pending',
-        Transaction.amount > 50000
-    ).all()
+    # Suspicious activity - only the top of the review queue, the rest is paginated
+    flagged_query = flagged_transactions_query()
+    flagged_count = flagged_query.count()
+    suspicious_transactions = flagged_query.limit(10).all()
     
     return render_template('admin/dashboard.html',
                          total_users=total_users,
@@ -70,10 +89,12 @@ def dashboard():
                          recent_users=recent_users,
                          recent_transactions=recent_transactions,
                          suspicious_transactions=suspicious_transactions,
+                         flagged_count=flagged_count,
                          format_currency=format_currency)
 
 @admin_bp.route('/users')
 @require_admin
+@read_replica
 def users():
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
@@ -123,6 +144,8 @@ def add_user_balance(user_id):
     transaction.status = 'completed'
     transaction.description = 'Admin balance adjustment'
     db.session.add(transaction)
+    db.session.flush()
+    record_completed([transaction.id])
     db.session.commit()
     
     flash(f'Added {format_currency(amount)} to {user.username} balance', 'success')
@@ -130,6 +153,7 @@ def add_user_balance(user_id):
 
 @admin_bp.route('/transactions')
 @require_admin
+@read_replica
 def transactions():
     page = request.args.get('page', 1, type=int)
     transaction_type = request.args.get('type', '')
@@ -160,25 +184,74 @@ def approve_transaction(transaction_id):
         flash('Transaction is not pending', 'error')
         return redirect(url_for('admin.transactions'))
     
+    if not transaction.is_flagged:
+        flash('Transaction is awaiting OTP confirmation, not review', 'error')
+        return redirect(url_for('admin.transactions'))
+    
     # Process the transaction
     if transaction.transaction_type == 'transfer':
-        sender = User.query.get(transaction.from_user_id)
-        recipient = User.query.get(transaction.to_user_id)
-        
-        if sender.balance >= transaction.amount:
-            sender.balance -= transaction.amount
-            recipient.balance += transaction.amount
-            transaction.status = 'completed'
-        else:
-            transaction.status = 'failed'
-            transaction.description += ' (Insufficient funds)'
+        completed_ids, _ = post_transfers([transaction_id])
+        start_approved_standing_orders(completed_ids)
     
     db.session.commit()
     flash(f'Transaction {transaction_id} has been processed', 'success')
     return redirect(url_for('admin.transactions'))
 
+@admin_bp.route('/review')
+@require_admin
+@read_replica
+def review_queue():
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', REVIEW_PAGE_SIZES[0], type=int)
+    if per_page not in REVIEW_PAGE_SIZES:
+        per_page = REVIEW_PAGE_SIZES[0]
+    
+    # Each row shows both parties and their risk badges
+    transactions = flagged_transactions_query().options(
+        joinedload(Transaction.sender), joinedload(Transaction.receiver)
+    ).paginate(page=page, per_page=per_page, error_out=False)
+    
+    return render_template('admin/review.html',
+                         transactions=transactions,
+                         per_page=per_page,
+                         page_sizes=REVIEW_PAGE_SIZES,
+                         format_currency=format_currency)
+
+@admin_bp.route('/review/bulk', methods=['POST'])
+@require_admin
+def bulk_review():
+    action = request.form.get('action')
+    transaction_ids = request.form.getlist('transaction_ids', type=int)
+    page = request.form.get('page', 1, type=int)
+    per_page = request.form.get('per_page', REVIEW_PAGE_SIZES[0], type=int)
+    
+    if not transaction_ids:
+        flash('Select at least one transaction', 'error')
+        return redirect(url_for('admin.review_queue', page=page, per_page=per_page))
+    
+    # Ignore ids that are not in the review queue, e.g. transfers awaiting an OTP
+    transaction_ids = db.session.scalars(
+        db.select(Transaction.id).where(Transaction.id.in_(transaction_ids), Transaction.is_flagged.is_(True))
+    ).all()
+    
+    if action == 'approve':
+        completed_ids, failed_ids = post_transfers(transaction_ids)
+        start_approved_standing_orders(completed_ids)
+        db.session.commit()
+        flash(f'Approved {len(completed_ids)} transactions, {len(failed_ids)} failed for insufficient funds', 'success')
+    elif action == 'reject':
+        rejected_ids = reject_transfers(transaction_ids)
+        db.session.commit()
+        flash(f'Rejected {len(rejected_ids)} transactions', 'success')
+    else:
+        flash('Unknown review action', 'error')
+    
+    logging.info(f"Admin {session['admin_id']} bulk {action} of {len(transaction_ids)} transactions")
+    return redirect(url_for('admin.review_queue', page=page, per_page=per_page))
+
 @admin_bp.route('/analytics')
 @require_admin
+@read_replica
 def analytics():
     # Get data for the last 30 days
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
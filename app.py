@@ -5,8 +5,10 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_bcrypt import Bcrypt
+from sqlalchemy.exc import DBAPIError, IntegrityError
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from db_routing import RoutingSession, REPLICA_BIND
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -14,7 +16,7 @@ logging.basicConfig(level=logging.DEBUG)
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 jwt = JWTManager()
 bcrypt = Bcrypt()
 
@@ -35,11 +37,25 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
 }
 
+# Optional read replica for read-only views (see db_routing.read_replica)
+if os.environ.get("REPLICA_DATABASE_URL"):
+    app.config["SQLALCHEMY_BINDS"] = {REPLICA_BIND: os.environ["REPLICA_DATABASE_URL"]}
+app.config["REPLICA_MAX_LAG_SECONDS"] = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 5))
+app.config["REPLICA_LAG_CHECK_INTERVAL"] = float(os.environ.get("REPLICA_LAG_CHECK_INTERVAL", 2))
+
 # Initialize extensions
 db.init_app(app)
 jwt.init_app(app)
 bcrypt.init_app(app)
 
+# Keep session data server-side; the cookie only carries a signed session id
+from sessions import init_sessions
+init_sessions(app)
+
+# Fingerprinted, precompressed static assets (built by assets.py)
+from assets import init_assets
+init_assets(app)
+
 # Register blueprints
 from auth import auth_bp
 from user_routes import user_bp
@@ -63,7 +79,20 @@ def current_year_filter(s):
 with app.app_context():
     # Import models to ensure tables are created
     import models
-    db.create_all()
+    # The web server, scheduler.py and outbox.py start together, so another
+    # process may create a table between create_all's check and its CREATE
+    for attempt in range(3):
+        try:
+            db.create_all()
+            break
+        except DBAPIError:
+            if attempt == 2:
+                raise
+            logging.info("Tables created concurrently by another process, checking again")
+    
+    # Add columns introduced after the database was created
+    from schema import upgrade_schema
+    upgrade_schema()
     
     # Create or update admin user
     from models import Admin
@@ -81,8 +110,12 @@ with app.app_context():
         admin.email = 'admin@swiftpay.com'
         admin.password_hash = bcrypt.generate_password_hash('SwiftPay2024!Admin').decode('utf-8')
         db.session.add(admin)
-        db.session.commit()
-        logging.info("Secure admin user created: username=swiftpay_admin")
+        try:
+            db.session.commit()
+            logging.info("Secure admin user created: username=swiftpay_admin")
+        except IntegrityError:
+            # Another process starting at the same time created it first
+            db.session.rollback()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,211 @@
+"""ASGI entry point for the async deployment mode.
+
+The high-QPS JSON endpoints (account lookup and dashboard data) and the
+live dashboard event stream are served natively on the async engine from
+async_db.py; every other request, including anything that moves money, is
+handed to the Flask app unchanged.
+
+Run with: uvicorn asgi:application --workers 4
+"""
+import asyncio
+import gc
+import json
+import logging
+from http.cookies import SimpleCookie
+from asgiref.wsgi import WsgiToAsgi
+from app import app
+from async_db import AsyncSession, async_engine
+from event_stream import hub, tail_outbox, replay_events, format_event, HEARTBEAT, HEARTBEAT_SECONDS
+from models import User
+from queries import recent_transactions_stmt, referral_earnings_stmt, account_holder_stmt, dashboard_payload, session_data_stmt
+from sessions import SqlSessionStore
+from user_routes import VERIFY_ACCOUNT_LIMITS
+from utils import validate_account_number
+import rate_limit
+
+wsgi_application = WsgiToAsgi(app)
+
+class Request:
+    """The parts of an ASGI HTTP request the async endpoints need"""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.headers = {k.decode('latin-1'): v.decode('latin-1') for k, v in scope['headers']}
+
+    @property
+    def client_ip(self):
+        # Mirrors ProxyFix(x_for=1) on the Flask side: trust the last forwarded hop
+        forwarded = self.headers.get('x-forwarded-for')
+        if forwarded:
+            return forwarded.split(',')[-1].strip()
+        client = self.scope.get('client')
+        return client[0] if client else 'unknown'
+
+    def cookie(self, name):
+        cookies = SimpleCookie(self.headers.get('cookie', ''))
+        return cookies[name].value if name in cookies else None
+
+    async def json(self):
+        body = b''
+        while True:
+            message = await self.receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        try:
+            return json.loads(body or b'null')
+        except ValueError:
+            return None
+
+    async def disconnected(self):
+        """Wait until the client goes away"""
+        while (await self.receive())['type'] != 'http.disconnect':
+            pass
+
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def load_session(request, db_session):
+    """Session dict for the request's cookie, read from the same store as Flask"""
+    interface = app.session_interface
+    sid = interface.session_id_from_cookie(app, request.cookie(app.config['SESSION_COOKIE_NAME']))
+    if not sid:
+        return {}
+    if isinstance(interface.store, SqlSessionStore):
+        data = await db_session.scalar(session_data_stmt(sid))
+    else:
+        data = interface.store.get(sid)
+    return interface.serializer.loads(data) if data else {}
+
+async def load_principal(request, db_session):
+    """Logged-in, non-suspended user for the request, or None"""
+    user_id = (await load_session(request, db_session)).get('user_id')
+    if user_id is None:
+        return None
+    user = await db_session.get(User, user_id)
+    if user is None or user.is_suspended:
+        return None
+    return user
+
+async def consume(key, limit):
+    """Take a rate-limit token without blocking the event loop on a shared backend"""
+    if isinstance(rate_limit.backend, rate_limit.MemoryBackend):
+        return rate_limit.backend.consume(key, limit)
+    return await asyncio.to_thread(_consume_in_app_context, key, limit)
+
+def _consume_in_app_context(key, limit):
+    with app.app_context():
+        return rate_limit.backend.consume(key, limit)
+
+async def verify_account(request, send):
+    if not await consume(f'verify_account:ip:{request.client_ip}', VERIFY_ACCOUNT_LIMITS['per_ip']):
+        return await send_json(send, {'success': False, 'message': 'Too many requests. Please wait a moment and try again.'}, 429)
+    async with AsyncSession() as db_session:
+        user = await load_principal(request, db_session)
+        if user is None:
+            return await send_json(send, {'success': False, 'message': 'Please login to access this page'}, 401)
+        if not await consume(f'verify_account:user:{user.id}', VERIFY_ACCOUNT_LIMITS['per_user']):
+            return await send_json(send, {'success': False, 'message': 'Too many requests. Please wait a moment and try again.'}, 429)
+
+        data = await request.json() or {}
+        account_number = data.get('account_number')
+        if not account_number or not validate_account_number(account_number):
+            return await send_json(send, {'success': False, 'message': 'Invalid account number'})
+
+        account_holder = await db_session.scalar(account_holder_stmt(account_number))
+    if account_holder:
+        return await send_json(send, {'success': True, 'account_holder': account_holder})
+    return await send_json(send, {'success': False, 'message': 'Account not found'})
+
+async def dashboard_data(request, send):
+    async with AsyncSession() as db_session:
+        user = await load_principal(request, db_session)
+        if user is None:
+            return await send_json(send, {'success': False, 'message': 'Please login to access this page'}, 401)
+        recent_transactions = (await db_session.scalars(recent_transactions_stmt(user.id))).all()
+        referral_earnings = await db_session.scalar(referral_earnings_stmt(user.id))
+        payload = dashboard_payload(user, recent_transactions, referral_earnings)
+    return await send_json(send, payload)
+
+async def events(request, send):
+    """Server-Sent Events stream of the user's completed transactions and balance"""
+    async with AsyncSession() as db_session:
+        user = await load_principal(request, db_session)
+        if user is None:
+            return await send_json(send, {'success': False, 'message': 'Please login to access this page'}, 401)
+    user_id = user.id
+    # Subscribe before replaying so nothing committed in between is lost
+    queue = hub.subscribe(user_id)
+    disconnected = asyncio.ensure_future(request.disconnected())
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')],
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+        last_event_id = request.headers.get('last-event-id', '')
+        if last_event_id.isdigit():
+            replayed = await replay_events(user_id, int(last_event_id))
+            if replayed:
+                await send({'type': 'http.response.body', 'body': b''.join(map(format_event, replayed)), 'more_body': True})
+        while True:
+            next_event = asyncio.ensure_future(queue.get())
+            await asyncio.wait({next_event, disconnected}, timeout=HEARTBEAT_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            if next_event.done():
+                body = format_event(next_event.result())
+            else:
+                next_event.cancel()
+                if disconnected.done():
+                    return
+                body = HEARTBEAT
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    except OSError:
+        # Some servers raise on writes to a client that went away instead of sending http.disconnect
+        return
+    finally:
+        disconnected.cancel()
+        hub.unsubscribe(user_id, queue)
+
+ASYNC_ROUTES = {
+    ('POST', '/user/verify_account'): verify_account,
+    ('GET', '/user/dashboard_data'): dashboard_data,
+    ('GET', '/user/events'): events,
+}
+
+async def lifespan(receive, send):
+    tail = None
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Everything loaded so far lives as long as the process; keep it out
+            # of full collections, whose pauses grow with the open streams
+            gc.freeze()
+            tail = asyncio.create_task(tail_outbox(hub))
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if tail is not None:
+                tail.cancel()
+            await async_engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http':
+        handler = ASYNC_ROUTES.get((scope['method'], scope['path']))
+        if handler is not None:
+            try:
+                return await handler(Request(scope, receive), send)
+            except Exception:
+                logging.exception(f"Async handler failed for {scope['path']}")
+                return await send_json(send, {'success': False, 'message': 'Internal server error'}, 500)
+    return await wsgi_application(scope, receive, send)
@@ -0,0 +1,184 @@
+"""Static asset pipeline: minify, fingerprint and precompress static/css and static/js.
+
+Build with: python assets.py
+The build writes static/dist/ plus a manifest; asset_url() then emits the
+fingerprinted URLs and /static/dist/ is served precompressed with immutable
+cache headers. Without a build, templates fall back to the raw files.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+SOURCES = ('css', 'js')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+# Encodings in order of preference, with the suffix of their precompressed file
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Link speeds for the transfer-time report, in kilobits per second
+LINK_SPEEDS = (('2G', 250), ('3G', 1600), ('4G', 12000))
+
+assets_bp = Blueprint('assets', __name__)
+
+def minify_css(source):
+    """Strip comments and redundant whitespace, leaving strings untouched"""
+    out = []
+    i = 0
+    while i < len(source):
+        char = source[i]
+        if char in '"\'':
+            end = i + 1
+            while end < len(source) and source[end] != char:
+                end += 2 if source[end] == '\\' else 1
+            out.append(source[i:end + 1])
+            i = end + 1
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = len(source) if end == -1 else end + 2
+        elif char.isspace():
+            while i < len(source) and source[i].isspace():
+                i += 1
+            if out and out[-1][-1:] not in '{};,:' and i < len(source) and source[i] not in '{};,':
+                out.append(' ')
+        else:
+            if char == '}' and out and out[-1] == ';':
+                out.pop()
+            out.append(char)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+def _skip_block_comments(line, in_block_comment):
+    """Drop block comments from the start of a stripped line; returns the rest and whether one is still open"""
+    while in_block_comment or line.startswith('/*'):
+        end = line.find('*/', 0 if in_block_comment else 2)
+        if end == -1:
+            return '', True
+        line = line[end + 2:].lstrip()
+        in_block_comment = False
+    return line, False
+
+def minify_js(source):
+    """Conservative JS minification: drop comments at the start of lines, indentation and blank lines.
+
+    Statements keep their own lines so automatic semicolon insertion is
+    unaffected, and lines inside template literals are left as written.
+    """
+    out = []
+    in_block_comment = False
+    in_template = False
+    for line in source.splitlines():
+        if not in_template:
+            line, in_block_comment = _skip_block_comments(line.strip(), in_block_comment)
+            if not line or line.startswith('//'):
+                continue
+        out.append(line)
+        if line.replace('\\`', '').count('`') % 2:
+            in_template = not in_template
+    return '\n'.join(out) + '\n'
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+def transfer_ms(size, kbps):
+    return size * 8 / kbps
+
+def build(static_folder):
+    """Build static/dist and its manifest; returns one report row per asset"""
+    dist = os.path.join(static_folder, BUILD_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+    report = []
+    for source_dir in SOURCES:
+        for root, _, files in os.walk(os.path.join(static_folder, source_dir)):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                logical = os.path.relpath(path, static_folder).replace(os.sep, '/')
+                stem, ext = os.path.splitext(logical)
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                minify = MINIFIERS.get(ext)
+                content = minify(raw.decode('utf-8')).encode('utf-8') if minify else raw
+                digest = hashlib.sha256(content).hexdigest()[:12]
+                built = f'{BUILD_DIR}/{stem}.{digest}{ext}'
+                target = os.path.join(static_folder, built)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as f:
+                    f.write(content)
+                gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzipped)
+                row = {'asset': logical, 'built': built, 'raw': len(raw), 'minified': len(content), 'gzip': len(gzipped)}
+                if brotli is not None:
+                    compressed = brotli.compress(content, quality=11)
+                    with open(target + '.br', 'wb') as f:
+                        f.write(compressed)
+                    row['br'] = len(compressed)
+                manifest[logical] = built
+                report.append(row)
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return report
+
+def format_report(report):
+    """Size and transfer-time table for build output and benchmarks"""
+    speeds = ' '.join(f'{label + " ms":>9}' for label, _ in LINK_SPEEDS)
+    lines = [f'{"asset":<16}{"raw":>9}{"minified":>10}{"gzip":>8}{"br":>8}  best-vs-raw {speeds}']
+    for row in report:
+        best = min(row['gzip'], row.get('br', row['gzip']))
+        times = ' '.join(f'{transfer_ms(row["raw"], kbps):>4.0f}>{transfer_ms(best, kbps):<4.0f}' for _, kbps in LINK_SPEEDS)
+        lines.append(
+            f'{row["asset"]:<16}{row["raw"]:>9}{row["minified"]:>10}{row["gzip"]:>8}{row.get("br", "-"):>8}'
+            f'  {best / row["raw"]:>10.0%}  {times}'
+        )
+    return '\n'.join(lines)
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, BUILD_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def asset_url(filename):
+    """url_for('static') that resolves to the fingerprinted build when one exists"""
+    built = current_app.extensions['asset_manifest'].get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.built_asset', filename=built[len(BUILD_DIR) + 1:])
+
+@assets_bp.route(f'/static/{BUILD_DIR}/<path:filename>')
+def built_asset(filename):
+    """Serve a fingerprinted asset, precompressed when the client accepts it"""
+    directory = os.path.join(current_app.static_folder, BUILD_DIR)
+    accepted = request.accept_encodings
+    for encoding, suffix in ENCODINGS:
+        if accepted[encoding] and os.path.isfile(os.path.join(directory, filename + suffix)):
+            response = send_from_directory(directory, filename + suffix, mimetype=_mimetype(filename))
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE
+    response.vary.add('Accept-Encoding')
+    return response
+
+def _mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+def init_assets(app):
+    """Register the fingerprinted asset route and the asset_url template helper"""
+    app.extensions['asset_manifest'] = load_manifest(app.static_folder)
+    app.register_blueprint(assets_bp)
+    app.jinja_env.globals['asset_url'] = asset_url
+
+if __name__ == '__main__':
+    print(format_report(build(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))))
@@ -0,0 +1,50 @@
+import os
+import logging
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from app import app
+
+# Async drivers for the sync URLs accepted in DATABASE_URL
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+# app.py logs at DEBUG, and aiosqlite logs every operation it runs at that level
+logging.getLogger('aiosqlite').setLevel(logging.WARNING)
+
+# libpq connection parameters asyncpg does not accept, e.g. in a hosted Postgres DATABASE_URL
+LIBPQ_ONLY_PARAMS = ('channel_binding',)
+
+def async_database_url(url):
+    """Translate a sync SQLAlchemy URL to the equivalent async driver"""
+    url = make_url(url)
+    url = url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+    if url.drivername == 'postgresql+asyncpg':
+        query = {k: v for k, v in url.query.items() if k not in LIBPQ_ONLY_PARAMS}
+        # asyncpg takes libpq's sslmode values under the name ssl
+        if 'sslmode' in query:
+            query['ssl'] = query.pop('sslmode')
+        url = url.set(query=query)
+    return url
+
+def _engine_options(url):
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': int(os.environ.get('ASYNC_DB_POOL_SIZE', 20)),
+        'max_overflow': int(os.environ.get('ASYNC_DB_MAX_OVERFLOW', 10)),
+        'pool_recycle': 300,
+        'pool_pre_ping': True,
+    }
+
+# Same database as the Flask app (app.py already resolved relative SQLite paths)
+with app.app_context():
+    from app import db
+    _sync_url = db.engine.url
+
+async_url = async_database_url(_sync_url)
+async_engine = create_async_engine(async_url, **_engine_options(async_url))
+AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
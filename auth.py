@@ -3,11 +3,17 @@ from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identi
 from app import db, bcrypt
 from models import User, Admin, Transaction
 from utils import generate_account_number, generate_referral_code
+from rate_limit import rate_limit, Limit
+from outbox import record_completed
 import logging
 
 auth_bp = Blueprint('auth', __name__)
 
+def login_email_key():
+    return (request.form.get('email') or '').strip().lower() or None
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@rate_limit('login', per_ip=Limit(20, per_seconds=60), per_user=Limit(5, per_seconds=60), user_key=login_email_key)
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
@@ -25,6 +31,7 @@ def login():
                 return render_template('auth/login.html')
             
             access_token = create_access_token(identity=user.id)
+            session.regenerate()
             session['access_token'] = access_token
             session['user_id'] = user.id
             
@@ -110,6 +117,8 @@ def signup():
                 transaction.status = 'completed'
                 transaction.description = f'Referral bonus for inviting {username}'
                 db.session.add(transaction)
+                db.session.flush()
+                record_completed([transaction.id])
                 db.session.commit()
                 
                 logging.info(f"Referral bonus of ₦1000 credited to {referrer.username}")
@@ -0,0 +1,101 @@
+"""Compare concurrent-connection throughput of the sync and async deployments.
+
+Starts gunicorn (sync workers, main:app) and uvicorn (asgi:application) on a
+shared SQLite database, then drives the dashboard_data JSON endpoint with many concurrent
+keep-alive connections.
+
+Run with: python benchmarks/bench_asgi.py [connections] [seconds]
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{_db_dir}/bench.db')
+os.environ.setdefault('SESSION_BACKEND', 'sql')
+
+from datetime import datetime, timedelta
+from app import app, db
+from models import User, Transaction, ServerSession
+
+WORKERS = 2
+
+def seed():
+    """Create users and transactions, returning a valid session cookie for user 1"""
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [{
+            'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+            'account_number': f'{i:010d}', 'referral_code': f'R{i:07d}', 'balance': 1000.0
+        } for i in range(1, 1001)])
+        db.session.execute(Transaction.__table__.insert(), [{
+            'from_user_id': i % 1000 + 1, 'to_user_id': 1, 'amount': 10.0, 'transaction_type': 'transfer',
+            'status': 'completed', 'created_at': datetime.utcnow()
+        } for i in range(5000)])
+        interface = app.session_interface
+        db.session.add(ServerSession(id='bench', data=interface.serializer.dumps({'user_id': 1}),
+                                     expires_at=datetime.utcnow() + timedelta(days=1)))
+        db.session.commit()
+        return interface._signer(app).sign('bench').decode()
+
+async def client(port, cookie, deadline, counts):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    request = f'GET /user/dashboard_data HTTP/1.1\r\nHost: x\r\nCookie: session={cookie}\r\n\r\n'.encode()
+    try:
+        while time.monotonic() < deadline:
+            writer.write(request)
+            await writer.drain()
+            headers = await reader.readuntil(b'\r\n\r\n')
+            length = next(int(line.split(b':')[1]) for line in headers.split(b'\r\n') if line.lower().startswith(b'content-length'))
+            await reader.readexactly(length)
+            counts[headers.split(b' ')[1].decode()] = counts.get(headers.split(b' ')[1].decode(), 0) + 1
+            if b'connection: close' in headers.lower():
+                writer.close()
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        counts['error'] = counts.get('error', 0) + 1
+    writer.close()
+
+async def load(port, cookie, connections, seconds):
+    counts = {}
+    deadline = time.monotonic() + seconds
+    await asyncio.gather(*(client(port, cookie, deadline, counts) for _ in range(connections)))
+    return counts
+
+def wait_for_port(port):
+    import socket
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server on port {port} did not start')
+
+def main():
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    cookie = seed()
+    env = dict(os.environ, RATE_LIMIT_BACKEND='memory')
+    servers = {
+        'sync (gunicorn)': (['gunicorn', '--workers', str(WORKERS), '--bind', '127.0.0.1:5101', 'main:app'], 5101),
+        'async (uvicorn)': (['uvicorn', '--workers', str(WORKERS), '--port', '5102', '--log-level', 'warning', 'asgi:application'], 5102),
+    }
+    for label, (command, port) in servers.items():
+        proc = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(port)
+            counts = asyncio.run(load(port, cookie, connections, seconds))
+        finally:
+            proc.terminate()
+            proc.wait()
+        ok = counts.get('200', 0)
+        print(f'{label}: {connections} connections, {ok / seconds:,.0f} req/s ok, status counts {counts}')
+
+if __name__ == '__main__':
+    main()
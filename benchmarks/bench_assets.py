@@ -0,0 +1,29 @@
+"""Report static asset sizes and transfer times before and after the asset build.
+
+Builds a scratch copy of static/ so the working tree is left untouched.
+
+Run with: python benchmarks/bench_assets.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from assets import build, format_report, LINK_SPEEDS
+
+def main():
+    scratch = os.path.join(tempfile.mkdtemp(), 'static')
+    shutil.copytree(os.path.join(ROOT, 'static'), scratch, ignore=shutil.ignore_patterns('dist'))
+    report = build(scratch)
+    print(format_report(report))
+    raw = sum(row['raw'] for row in report)
+    best = sum(min(row['gzip'], row.get('br', row['gzip'])) for row in report)
+    print(f'\ntotal: {raw} bytes raw -> {best} bytes on the wire ({best / raw:.0%})')
+    for label, kbps in LINK_SPEEDS:
+        print(f'  first view on {label}: {raw * 8 / kbps:.0f} ms -> {best * 8 / kbps:.0f} ms; repeat views: 0 requests (immutable)')
+
+if __name__ == '__main__':
+    main()
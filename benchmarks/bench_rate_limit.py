@@ -0,0 +1,47 @@
+"""Measure the per-check overhead of the rate limiter backends and decorator.
+
+Run with: python benchmarks/bench_rate_limit.py [iterations]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{_db_dir}/bench.db')
+
+from app import app
+from rate_limit import Limit, MemoryBackend, DatabaseBackend, rate_limit
+import rate_limit as rate_limit_module
+
+LIMIT = Limit(10**9, per_seconds=1)
+
+def per_check(label, check, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        check(i)
+    elapsed = time.perf_counter() - start
+    print(f'{label:>28}: {elapsed / iterations * 1e6:8.2f}us per check')
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    memory = MemoryBackend()
+    per_check('memory, hot key', lambda i: memory.consume('bench:ip:1.2.3.4', LIMIT), iterations)
+    per_check('memory, 10k distinct keys', lambda i: memory.consume(f'bench:ip:{i % 10000}', LIMIT), iterations)
+
+    rate_limit_module.backend = memory
+
+    @rate_limit('bench', per_ip=LIMIT, per_user=LIMIT, user_key=lambda: 42)
+    def view():
+        return 'ok'
+
+    with app.test_request_context('/', method='POST'):
+        per_check('decorator, ip + user', lambda i: view(), iterations)
+
+    with app.app_context():
+        database = DatabaseBackend()
+        per_check('database (sqlite stand-in)', lambda i: database.consume(f'bench:ip:{i % 100}', LIMIT), max(iterations // 100, 100))
+
+if __name__ == '__main__':
+    main()
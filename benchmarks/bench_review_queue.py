@@ -0,0 +1,64 @@
+"""Benchmark bulk approval of flagged transfers against one-by-one approval.
+
+Run with: python benchmarks/bench_review_queue.py [count]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{_db_dir}/bench.db')
+
+from app import app, db
+from models import User, Transaction
+from ledger import post_transfers
+
+USERS = 1000
+
+def seed(count):
+    db.session.query(Transaction).delete()
+    db.session.query(User).delete()
+    db.session.execute(User.__table__.insert(), [{
+        'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+        'account_number': f'{i:010d}', 'referral_code': f'R{i:07d}', 'balance': 1_000_000.0
+    } for i in range(1, USERS + 1)])
+    db.session.execute(Transaction.__table__.insert(), [{
+        'from_user_id': i % USERS + 1, 'to_user_id': (i * 7) % USERS + 1, 'amount': 60000.0,
+        'transaction_type': 'transfer', 'status': 'pending', 'description': 'bench', 'risk_score': 0.6
+    } for i in range(count)])
+    db.session.commit()
+    return [row[0] for row in db.session.query(Transaction.id).all()]
+
+def approve_one_by_one(ids):
+    for transaction_id in ids:
+        transaction = Transaction.query.get(transaction_id)
+        sender = User.query.get(transaction.from_user_id)
+        recipient = User.query.get(transaction.to_user_id)
+        if sender.balance >= transaction.amount:
+            sender.balance -= transaction.amount
+            recipient.balance += transaction.amount
+            transaction.status = 'completed'
+        else:
+            transaction.status = 'failed'
+        db.session.commit()
+
+def approve_bulk(ids):
+    completed_ids, failed_ids = post_transfers(ids)
+    db.session.commit()
+    return completed_ids, failed_ids
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    with app.app_context():
+        for label, approve in (('one-by-one', approve_one_by_one), ('bulk', approve_bulk)):
+            ids = seed(count)
+            start = time.perf_counter()
+            approve(ids)
+            elapsed = time.perf_counter() - start
+            completed = Transaction.query.filter_by(status='completed').count()
+            print(f'{label:>10}: approved {completed}/{count} in {elapsed:.3f}s ({count / elapsed:,.0f} items/s)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark executing due standing orders, optionally with several worker processes.
+
+Seeds 100k due schedules (by default), runs the workers to completion and
+checks that every schedule was executed exactly once.
+
+Run with: python benchmarks/bench_scheduler.py [schedules] [nodes] [batch_size]
+"""
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Process
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{_db_dir}/bench.db')
+
+from datetime import datetime, timedelta
+from app import app, db
+from models import User, Transaction, ScheduledTransfer
+from scheduler import run_once
+
+USERS = 10000
+
+def seed(count):
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [{
+            'id': i, 'username': f'u{i}', 'email': f'u{i}@example.com', 'password_hash': 'x',
+            'account_number': f'{i:010d}', 'referral_code': f'R{i:07d}', 'balance': 1_000_000.0
+        } for i in range(1, USERS + 1)])
+        due = datetime.utcnow() - timedelta(minutes=1)
+        db.session.execute(ScheduledTransfer.__table__.insert(), [{
+            'user_id': i % USERS + 1, 'to_user_id': (i * 7 + 3) % USERS + 1, 'amount': 100.0,
+            'description': 'Standing order', 'interval': 'monthly', 'next_run_at': due,
+            'is_active': True, 'run_count': 0
+        } for i in range(count)])
+        db.session.commit()
+
+def worker(node_id, batch_size):
+    with app.app_context():
+        run_once(node_id, batch_size)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nodes = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+    seed(count)
+
+    start = time.perf_counter()
+    processes = [Process(target=worker, args=(f'node-{n}', batch_size)) for n in range(nodes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        executed = Transaction.query.filter_by(transaction_type='transfer').count()
+        runs = db.session.scalar(db.select(db.func.sum(ScheduledTransfer.run_count)))
+        still_due = ScheduledTransfer.query.filter(ScheduledTransfer.next_run_at <= datetime.utcnow()).count()
+    print(f'{count:,} schedules, {nodes} node(s), batch {batch_size}: {elapsed:.1f}s '
+          f'({count / elapsed:,.0f}/s); transfers={executed:,} runs={runs:,} still due={still_due}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Load test the live dashboard event stream with many concurrent idle connections.
+
+Starts uvicorn (asgi:application) on a SQLite database, opens one
+/user/events stream per seeded user, measures the server's memory and idle
+CPU with every stream open, then posts a batch of transfers through the
+ledger and measures how long the outbox takes to reach the affected streams.
+
+Run with: python benchmarks/bench_sse.py [connections] [transfers] [workers]
+"""
+import asyncio
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{_db_dir}/bench.db')
+os.environ.setdefault('SESSION_BACKEND', 'sql')
+
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import app, db
+from models import User, Transaction, ServerSession
+from ledger import post_transfers
+from bench_asgi import wait_for_port
+
+PORT = 5103
+CONNECT_CONCURRENCY = 200
+IDLE_SECONDS = 20
+
+def seed(users):
+    """Create users with one server-side session each, returning their session cookies"""
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [{
+            'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+            'account_number': f'{i:010d}', 'referral_code': f'R{i:07d}', 'balance': 1000.0
+        } for i in range(1, users + 1)])
+        interface = app.session_interface
+        expires_at = datetime.utcnow() + timedelta(days=1)
+        db.session.execute(ServerSession.__table__.insert(), [{
+            'id': f'bench{i}', 'data': interface.serializer.dumps({'user_id': i}), 'expires_at': expires_at
+        } for i in range(1, users + 1)])
+        db.session.commit()
+        signer = interface._signer(app)
+        return {i: signer.sign(f'bench{i}').decode() for i in range(1, users + 1)}
+
+def post_batch(users, transfers):
+    """Post transfers from the first users to the second half in one ledger batch; returns the commit time"""
+    with app.app_context():
+        half = users // 2
+        transaction_ids = db.session.scalars(
+            insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+            [{
+                'from_user_id': i, 'to_user_id': i + half, 'amount': 10.0, 'transaction_type': 'transfer',
+                'status': 'pending', 'created_at': datetime.utcnow()
+            } for i in range(1, transfers + 1)]
+        ).all()
+        post_transfers(transaction_ids)
+        db.session.commit()
+        return time.perf_counter()
+
+class Stream:
+    def __init__(self, user_id, cookie):
+        self.user_id = user_id
+        self.cookie = cookie
+        self.received = []
+        self.heartbeats = 0
+
+    async def open(self, gate):
+        async with gate:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', PORT)
+            self.writer.write(f'GET /user/events HTTP/1.1\r\nHost: x\r\nAccept: text/event-stream\r\n'
+                              f'Cookie: session={self.cookie}\r\n\r\n'.encode())
+            await self.writer.drain()
+            headers = await self.reader.readuntil(b'\r\n\r\n')
+            if b' 200 ' not in headers.split(b'\r\n')[0]:
+                raise RuntimeError(f'stream for user {self.user_id} failed: {headers.splitlines()[0]!r}')
+
+    async def listen(self):
+        try:
+            while True:
+                chunk = await self.reader.readuntil(b'\n\n')
+                if b'event: transaction' in chunk:
+                    self.received.append(time.perf_counter())
+                elif b': keepalive' in chunk:
+                    self.heartbeats += 1
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+
+def process_stats(pid):
+    """RSS in MiB and CPU seconds used so far by a process and its worker processes"""
+    with open(f'/proc/{pid}/status') as f:
+        rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS')) / 1024
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        for child in f.read().split():
+            child_rss, child_cpu = process_stats(int(child))
+            rss += child_rss
+            cpu += child_cpu
+    return rss, cpu
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+async def run(pid, cookies, transfers):
+    baseline_rss, _ = process_stats(pid)
+    streams = [Stream(user_id, cookie) for user_id, cookie in cookies.items()]
+    gate = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    start = time.perf_counter()
+    await asyncio.gather(*(stream.open(gate) for stream in streams))
+    connected = time.perf_counter() - start
+    listeners = [asyncio.create_task(stream.listen()) for stream in streams]
+    # Keep this process's own collector pauses out of the latency figures
+    gc.freeze()
+    rss, cpu_before = process_stats(pid)
+    print(f'{len(streams):,} streams open in {connected:.1f}s; server RSS {baseline_rss:.0f} -> {rss:.0f} MiB '
+          f'({(rss - baseline_rss) * 1024 / len(streams):.1f} KiB per stream)')
+
+    await asyncio.sleep(IDLE_SECONDS)
+    _, cpu_after = process_stats(pid)
+    heartbeats = sum(stream.heartbeats for stream in streams)
+    print(f'idle for {IDLE_SECONDS}s: server CPU {(cpu_after - cpu_before) / IDLE_SECONDS:.1%}, '
+          f'{heartbeats:,} heartbeats delivered')
+
+    committed = await asyncio.to_thread(post_batch, len(streams), transfers)
+    expected = {stream.user_id for stream in streams
+                if stream.user_id <= transfers or len(streams) // 2 < stream.user_id <= len(streams) // 2 + transfers}
+    deadline = time.perf_counter() + 10
+    while time.perf_counter() < deadline and any(not s.received for s in streams if s.user_id in expected):
+        await asyncio.sleep(0.05)
+    latencies = [(s.received[0] - committed) * 1000 for s in streams if s.user_id in expected and s.received]
+    stray = sum(1 for s in streams if s.user_id not in expected and s.received)
+    print(f'{transfers:,} transfers posted: {len(latencies):,}/{len(expected):,} streams updated, '
+          f'commit-to-client p50 {percentile(latencies, 0.5):.0f} ms, p99 {percentile(latencies, 0.99):.0f} ms, '
+          f'max {max(latencies):.0f} ms; {stray} unrelated streams received events')
+
+    for listener in listeners:
+        listener.cancel()
+    for stream in streams:
+        stream.writer.close()
+
+def main():
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    transfers = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    cookies = seed(connections)
+    env = dict(os.environ, RATE_LIMIT_BACKEND='memory')
+    command = ['uvicorn', '--workers', str(workers), '--port', str(PORT), '--log-level', 'warning',
+               '--backlog', '4096', 'asgi:application']
+    proc = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(PORT)
+        # Let every worker finish starting before taking the memory baseline
+        time.sleep(2 * workers)
+        print(f'uvicorn, {workers} worker(s)')
+        asyncio.run(run(proc.pid, cookies, transfers))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import time
+import logging
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, UpdateBase, event, text
+
+REPLICA_BIND = 'replica'
+
+# Replication lag probes per dialect, in seconds. Dialects without one (the
+# SQLite stand-in) report no lag.
+LAG_QUERIES = {
+    'postgresql': (
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    ),
+}
+
+_lag_cache = {'checked_at': 0.0, 'lag': 0.0}
+
+def replica_lag(engine):
+    """Replica lag in seconds, re-measured at most every REPLICA_LAG_CHECK_INTERVAL seconds"""
+    now = time.monotonic()
+    if now - _lag_cache['checked_at'] < current_app.config['REPLICA_LAG_CHECK_INTERVAL']:
+        return _lag_cache['lag']
+    query = LAG_QUERIES.get(engine.dialect.name)
+    lag = 0.0
+    if query:
+        try:
+            with engine.connect() as conn:
+                lag = float(conn.execute(text(query)).scalar() or 0)
+        except Exception:
+            logging.exception("Could not measure replica lag; routing reads to primary")
+            lag = float('inf')
+    _lag_cache.update(checked_at=now, lag=lag)
+    return lag
+
+class RoutingSession(Session):
+    """Session that sends reads from read_replica views to the replica bind.
+
+    Anything that writes, locks rows or runs after a flush in the current
+    transaction stays on the primary, as do all reads when the replica lags
+    more than REPLICA_MAX_LAG_SECONDS.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        if isinstance(clause, UpdateBase):
+            self.info['wrote'] = True
+            return False
+        if not has_app_context() or not g.get('read_replica'):
+            return False
+        if self._flushing or self.info.get('wrote'):
+            return False
+        if isinstance(clause, Select) and clause._for_update_arg is not None:
+            return False
+        engines = self._db.engines
+        if REPLICA_BIND not in engines:
+            return False
+        return replica_lag(engines[REPLICA_BIND]) <= current_app.config['REPLICA_MAX_LAG_SECONDS']
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_written(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_to_primary(db_session):
+    # Keep this browser session on the primary until the replica has caught up
+    # with what it just wrote (read-your-writes)
+    if db_session.info.pop('wrote', False) and has_request_context() and REPLICA_BIND in db_session._db.engines:
+        session['primary_until'] = time.time() + current_app.config['REPLICA_MAX_LAG_SECONDS']
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _reset_written(db_session):
+    db_session.info.pop('wrote', None)
+
+def read_replica(f):
+    """Decorator to serve a read-only view from the replica when one is configured"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.read_replica = session.get('primary_until', 0) < time.time()
+        return f(*args, **kwargs)
+    return decorated_function
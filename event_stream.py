@@ -0,0 +1,99 @@
+"""Live dashboard updates over Server-Sent Events, for the async deployment mode.
+
+Each worker process runs one tail task that polls the outbox on the async
+engine and fans new events out to the open streams of the accounts they
+belong to. Polling costs one query per interval however many dashboards are
+open, and an idle stream is only a queue plus a periodic heartbeat.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from sqlalchemy import func, or_, select
+from async_db import AsyncSession
+from models import OutboxEvent
+from queries import outbox_events_stmt, event_payload
+
+POLL_SECONDS = 0.5
+TAIL_BATCH_SIZE = 1000
+HEARTBEAT_SECONDS = 15
+# Events buffered per stream; a client that falls further behind loses the oldest
+QUEUE_SIZE = 100
+# Events replayed to a reconnecting client from its Last-Event-ID
+REPLAY_LIMIT = 20
+# Ids skipped by the tail are re-checked for this long, since concurrent
+# writers can commit events out of id order
+GAP_SECONDS = 5
+MAX_GAPS = 1000
+
+class EventHub:
+    """Per-process registry of open streams, keyed by user id"""
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._streams = defaultdict(set)
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(self.queue_size)
+        self._streams[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        streams = self._streams.get(user_id)
+        if streams is not None:
+            streams.discard(queue)
+            if not streams:
+                del self._streams[user_id]
+
+    def publish(self, user_id, payload):
+        for queue in self._streams.get(user_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(payload)
+
+    @property
+    def connections(self):
+        return sum(len(streams) for streams in self._streams.values())
+
+hub = EventHub()
+
+async def tail_outbox(hub, poll_seconds=POLL_SECONDS, batch_size=TAIL_BATCH_SIZE):
+    """Publish outbox events written after startup to the hub, forever"""
+    async with AsyncSession() as db_session:
+        last_id = await db_session.scalar(select(func.max(OutboxEvent.id))) or 0
+    gaps = {}
+    while True:
+        try:
+            condition = OutboxEvent.id > last_id
+            if gaps:
+                condition = or_(condition, OutboxEvent.id.in_(list(gaps)))
+            async with AsyncSession() as db_session:
+                rows = (await db_session.execute(outbox_events_stmt().where(condition).limit(batch_size))).all()
+            now = time.monotonic()
+            for row in rows:
+                gaps.pop(row.event_id, None)
+                if row.event_id > last_id:
+                    if row.event_id - last_id - 1 <= MAX_GAPS:
+                        gaps.update(dict.fromkeys(range(last_id + 1, row.event_id), now))
+                    last_id = row.event_id
+                hub.publish(row.user_id, event_payload(row))
+            gaps = {gap: seen for gap, seen in gaps.items() if now - seen < GAP_SECONDS}
+            if len(rows) == batch_size:
+                continue
+        except Exception:
+            logging.exception("Outbox tail failed")
+        await asyncio.sleep(poll_seconds)
+
+async def replay_events(user_id, after_id, limit=REPLAY_LIMIT):
+    """Events for user_id after after_id, so a reconnecting client does not miss any"""
+    async with AsyncSession() as db_session:
+        rows = (await db_session.execute(outbox_events_stmt().where(
+            OutboxEvent.user_id == user_id, OutboxEvent.id > after_id
+        ).limit(limit))).all()
+    return [event_payload(row) for row in rows]
+
+def format_event(payload):
+    return f"id: {payload['id']}\nevent: transaction\ndata: {json.dumps(payload)}\n\n".encode()
+
+HEARTBEAT = b': keepalive\n\n'
@@ -0,0 +1,111 @@
+from collections import defaultdict
+from sqlalchemy import Float, Integer, case, column, func, update, values
+from app import db
+from models import User, Transaction
+from outbox import record_completed
+
+# Accounts per UPDATE where the deltas are written as a CASE over account ids
+CASE_CHUNK_SIZE = 500
+
+def _apply_balance_deltas(deltas):
+    """Apply per-user balance deltas with one UPDATE statement.
+
+    On Postgres the deltas are joined in as a VALUES list, so any number of
+    accounts is one round trip. Other databases get a CASE over the account
+    ids, CASE_CHUNK_SIZE accounts per statement to stay within their bound
+    parameter limits.
+    """
+    deltas = [(uid, delta) for uid, delta in deltas.items() if delta]
+    if not deltas:
+        return
+    user_table = User.__table__
+    if db.engine.dialect.name == 'postgresql':
+        rows = values(column('id', Integer), column('delta', Float), name='deltas').data(deltas)
+        db.session.execute(update(user_table).where(user_table.c.id == rows.c.id).values(
+            balance=user_table.c.balance + rows.c.delta
+        ))
+        return
+    for start in range(0, len(deltas), CASE_CHUNK_SIZE):
+        chunk = dict(deltas[start:start + CASE_CHUNK_SIZE])
+        db.session.execute(update(user_table).where(user_table.c.id.in_(chunk)).values(
+            balance=user_table.c.balance + case(chunk, value=user_table.c.id)
+        ))
+
+def _append_description(ids, suffix):
+    """Append a note to the description of every transaction in ids"""
+    db.session.execute(
+        update(Transaction).where(Transaction.id.in_(ids)).values(
+            description=func.coalesce(Transaction.description, '') + suffix
+        ),
+        execution_options={'synchronize_session': False}
+    )
+
+def lock_pending_transfers(transaction_ids):
+    """Lock and return the pending transfers among transaction_ids in posting order"""
+    if not transaction_ids:
+        return []
+    return Transaction.query.filter(
+        Transaction.id.in_(transaction_ids),
+        Transaction.status == 'pending',
+        Transaction.transaction_type == 'transfer'
+    ).order_by(Transaction.id).with_for_update().all()
+
+def post_transfers(transaction_ids):
+    """Post a batch of pending transfers in one database transaction.
+
+    Senders and recipients are locked together, transfers are checked against
+    running balances in id order (the same outcome as approving them one by one)
+    and all balance changes are written with one UPDATE, followed by outbox
+    events for the completed ones. The caller commits. Returns a (completed_ids, failed_ids) tuple.
+    """
+    transfers = lock_pending_transfers(transaction_ids)
+    if not transfers:
+        return [], []
+
+    user_ids = {t.from_user_id for t in transfers} | {t.to_user_id for t in transfers}
+    balances = dict(db.session.query(User.id, User.balance).filter(
+        User.id.in_(user_ids)
+    ).order_by(User.id).with_for_update().all())
+
+    deltas = defaultdict(float)
+    completed_ids = []
+    failed_ids = []
+    for transfer in transfers:
+        available = (balances.get(transfer.from_user_id) or 0) + deltas[transfer.from_user_id]
+        if transfer.to_user_id in balances and available >= transfer.amount:
+            deltas[transfer.from_user_id] -= transfer.amount
+            deltas[transfer.to_user_id] += transfer.amount
+            completed_ids.append(transfer.id)
+        else:
+            failed_ids.append(transfer.id)
+
+    _apply_balance_deltas(deltas)
+    if completed_ids:
+        db.session.execute(
+            update(Transaction).where(Transaction.id.in_(completed_ids)).values(status='completed'),
+            execution_options={'synchronize_session': False}
+        )
+        record_completed(completed_ids)
+    if failed_ids:
+        db.session.execute(
+            update(Transaction).where(Transaction.id.in_(failed_ids)).values(status='failed'),
+            execution_options={'synchronize_session': False}
+        )
+        _append_description(failed_ids, ' (Insufficient funds)')
+
+    # Loaded rows are stale after the bulk updates
+    db.session.expire_all()
+    return completed_ids, failed_ids
+
+def reject_transfers(transaction_ids, reason='Rejected by admin'):
+    """Mark a batch of pending transfers as failed without moving funds. The caller commits."""
+    transfers = lock_pending_transfers(transaction_ids)
+    rejected_ids = [t.id for t in transfers]
+    if rejected_ids:
+        db.session.execute(
+            update(Transaction).where(Transaction.id.in_(rejected_ids)).values(status='failed'),
+            execution_options={'synchronize_session': False}
+        )
+        _append_description(rejected_ids, f' ({reason})')
+        db.session.expire_all()
+    return rejected_ids
@@ -13,6 +13,7 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime, default=datetime.utcnow)
     is_suspended = db.Column(db.Boolean, default=False)
+    risk_score = db.Column(db.Float, default=0.0)  # Written by fraud_scanner.py
     
     # Relationships
     sent_transactions = db.relationship('Transaction', foreign_keys='Transaction.from_user_id', backref='sender', lazy='dynamic')
@@ -30,6 +31,9 @@ class Transaction(db.Model):
     transaction_type = db.Column(db.String(20), nullable=False)  # transfer, deposit, withdrawal, referral_bonus
     status = db.Column(db.String(20), default='pending')  # pending, completed, failed
     description = db.Column(db.String(200))
+    risk_score = db.Column(db.Float, default=0.0, index=True)  # Used to order the admin review queue
+    is_flagged = db.Column(db.Boolean, default=False, index=True)  # Held for admin review instead of OTP confirmation
+    repeat_interval = db.Column(db.String(20), nullable=True)  # Standing order requested on a held transfer, started when it is approved
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
@@ -73,3 +77,76 @@ class OTP(db.Model):
     
     def is_expired(self):
         return datetime.utcnow() > self.expires_at
+
+class RateLimitBucket(db.Model):
+    key = db.Column(db.String(200), primary_key=True)  # scope:ip:<addr> or scope:user:<id>
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)  # Unix timestamp of the last refill
+    full_at = db.Column(db.Float, nullable=False, index=True)  # Unix timestamp when the bucket is full again
+    
+    def __repr__(self):
+        return f'<RateLimitBucket {self.key}: {self.tokens:.2f}>'
+
+class ServerSession(db.Model):
+    id = db.Column(db.String(64), primary_key=True)  # Session id carried in the signed cookie
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<ServerSession {self.id[:8]}... expires {self.expires_at}>'
+
+class ScheduledTransfer(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    to_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    description = db.Column(db.String(200))
+    interval = db.Column(db.String(20), nullable=False)  # daily, weekly, monthly
+    next_run_at = db.Column(db.DateTime, nullable=False)
+    is_active = db.Column(db.Boolean, default=True)
+    claimed_by = db.Column(db.String(64), nullable=True)  # Worker holding the lease
+    claimed_until = db.Column(db.DateTime, nullable=True)
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    last_status = db.Column(db.String(20), nullable=True)  # completed, failed
+    last_transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'), nullable=True)
+    run_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Index backing the "next due" queue
+    __table_args__ = (db.Index('ix_scheduled_transfer_due', 'is_active', 'next_run_at'),)
+    
+    recipient = db.relationship('User', foreign_keys=[to_user_id])
+    
+    def __repr__(self):
+        return f'<ScheduledTransfer {self.id}: {self.user_id} -> {self.to_user_id} ₦{self.amount} {self.interval}>'
+
+class OutboxEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)  # transaction.completed
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Account whose feed the event belongs to
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'), nullable=False)
+    balance = db.Column(db.Float, nullable=False)  # The user's balance once the transaction was posted
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    dispatched_at = db.Column(db.DateTime, nullable=True)  # Set once queued for every webhook sink subscribed to it
+    
+    # Indexes backing the dispatcher's "not yet queued" scan and SSE replay per account
+    __table_args__ = (
+        db.Index('ix_outbox_event_pending', 'dispatched_at', 'id'),
+        db.Index('ix_outbox_event_user', 'user_id', 'id'),
+    )
+    
+    transaction = db.relationship('Transaction')
+    
+    def __repr__(self):
+        return f'<OutboxEvent {self.id}: {self.event_type} for user {self.user_id}>'
+
+class OutboxDelivery(db.Model):
+    event_id = db.Column(db.Integer, db.ForeignKey('outbox_event.id'), primary_key=True)  # Deleted once the sink accepts it
+    sink = db.Column(db.String(500), primary_key=True)  # Name the sink is registered under
+    attempts = db.Column(db.Integer, default=0)
+    
+    # Index backing each sink's "oldest undelivered" scan
+    __table_args__ = (db.Index('ix_outbox_delivery_sink', 'sink', 'event_id'),)
+    
+    def __repr__(self):
+        return f'<OutboxDelivery {self.event_id} to {self.sink}>'
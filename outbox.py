@@ -0,0 +1,276 @@
+"""Transactional outbox for completed transactions.
+
+record_completed() writes one OutboxEvent per affected account inside the
+database transaction that moves the money, so an event exists exactly when
+the transaction committed. Two consumers read the outbox:
+
+- the dispatcher (python outbox.py) queues each new event for every
+  registered webhook sink subscribed to it, then delivers each sink's queue
+  in batches and at least once; partners should deduplicate on the event id.
+  Sinks keep separate queues and backoff, so one failing partner neither
+  holds up the others nor causes them to be sent events again
+- event_stream.py tails it in the async deployment mode and pushes the
+  events to open dashboards over Server-Sent Events
+
+Run with: python outbox.py [--batch-size N] [--once]
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from sqlalchemy import delete, exists, insert, literal, select, union_all, update
+from app import db
+from models import User, Transaction, OutboxEvent, OutboxDelivery
+from queries import outbox_events_stmt, event_payload
+
+TRANSACTION_COMPLETED = 'transaction.completed'
+BATCH_SIZE = 500
+POLL_SECONDS = 1
+MAX_BACKOFF_SECONDS = 300
+# Dispatched events are purged whenever the outbox is drained, and at least this often under load
+PURGE_SECONDS = 60
+# Dispatched events are kept this long so reconnecting dashboards can replay them
+RETENTION = timedelta(days=1)
+
+class Subscription:
+    """A webhook sink and the events it receives.
+
+    The sink is any callable taking a list of event payloads that raises when
+    the batch was not accepted. event_types and user_ids narrow the events
+    delivered to it; None means all of them.
+    """
+    __slots__ = ('sink', 'event_types', 'user_ids')
+
+    def __init__(self, sink, event_types=None, user_ids=None):
+        self.sink = sink
+        self.event_types = None if event_types is None else frozenset(event_types)
+        self.user_ids = None if user_ids is None else frozenset(user_ids)
+
+    def matches(self, event_type, user_id):
+        return ((self.event_types is None or event_type in self.event_types) and
+                (self.user_ids is None or user_id in self.user_ids))
+
+# Subscriptions by sink name
+sinks = {}
+
+def register_sink(name, sink, event_types=None, user_ids=None):
+    sinks[name] = Subscription(sink, event_types, user_ids)
+
+def record_completed(transaction_ids):
+    """Write transaction.completed events for the completed transactions among transaction_ids.
+
+    Events are inserted with one INSERT ... SELECT, one row for the sender and
+    one for the recipient of each transaction, carrying the account's balance
+    as of this database transaction. The caller commits.
+    """
+    if not transaction_ids:
+        return
+    # ORM balance and status changes must reach the database before the SELECT reads them
+    db.session.flush()
+    transaction_table = Transaction.__table__
+    user_table = User.__table__
+    now = datetime.utcnow()
+    sides = [
+        select(
+            literal(TRANSACTION_COMPLETED), user_table.c.id, transaction_table.c.id,
+            user_table.c.balance, literal(now)
+        ).join_from(transaction_table, user_table, user_table.c.id == account_column).where(
+            transaction_table.c.id.in_(transaction_ids),
+            transaction_table.c.status == 'completed'
+        )
+        for account_column in (transaction_table.c.from_user_id, transaction_table.c.to_user_id)
+    ]
+    outbox_table = OutboxEvent.__table__
+    db.session.execute(insert(outbox_table).from_select(
+        ['event_type', 'user_id', 'transaction_id', 'balance', 'created_at'],
+        union_all(*sides)
+    ))
+
+class WebhookSink:
+    """POSTs batches of events to a partner URL as JSON, signed with HMAC-SHA256"""
+
+    def __init__(self, url, secret, timeout=10):
+        if not secret:
+            raise ValueError(f'Webhook sink {url} needs a signing secret')
+        self.url = url
+        self.secret = secret.encode()
+        self.timeout = timeout
+
+    def __call__(self, events):
+        body = json.dumps({'events': events}).encode()
+        signature = hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        request = urllib.request.Request(self.url, data=body, method='POST', headers={
+            'Content-Type': 'application/json',
+            'X-SwiftPay-Signature': f'sha256={signature}',
+        })
+        # Non-2xx responses raise HTTPError, leaving the batch for a retry
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+def register_env_sinks():
+    """Register a WebhookSink for each partner in PARTNER_WEBHOOKS.
+
+    PARTNER_WEBHOOKS is a JSON list of {"url", "user_ids", "event_types",
+    "secret"} objects; user_ids and event_types are optional filters and
+    secret defaults to PARTNER_WEBHOOK_SECRET. Partners authenticate
+    deliveries by their signature, so a partner without a secret is logged
+    and skipped, as is any other malformed entry; the dispatcher keeps
+    running for the rest, and to purge the outbox.
+    """
+    default_secret = os.environ.get('PARTNER_WEBHOOK_SECRET')
+    try:
+        partners = json.loads(os.environ.get('PARTNER_WEBHOOKS') or '[]')
+    except ValueError:
+        logging.exception("PARTNER_WEBHOOKS is not valid JSON; no partner webhooks registered")
+        return
+    for partner in partners:
+        url = partner.get('url') if isinstance(partner, dict) else None
+        try:
+            secret = partner.get('secret') or default_secret
+            if not secret:
+                raise ValueError(f"Partner webhook {partner['url']} has no secret and PARTNER_WEBHOOK_SECRET is not set")
+            register_sink(partner['url'], WebhookSink(partner['url'], secret),
+                          partner.get('event_types'), partner.get('user_ids'))
+        except Exception:
+            # Log the URL only; the entry may carry a secret
+            logging.exception(f"Skipping misconfigured partner webhook {url or '(no url)'}")
+
+def queue_batch(batch_size=BATCH_SIZE):
+    """Queue the oldest undispatched events for the sinks subscribed to them; returns how many were queued.
+
+    On Postgres the batch is locked with FOR UPDATE SKIP LOCKED, so several
+    dispatchers can run side by side. Events no sink subscribes to are just
+    marked dispatched.
+    """
+    rows = db.session.execute(
+        select(OutboxEvent.id, OutboxEvent.event_type, OutboxEvent.user_id)
+        .where(OutboxEvent.dispatched_at.is_(None)).order_by(OutboxEvent.id).limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not rows:
+        db.session.rollback()
+        return 0
+    deliveries = [
+        {'event_id': row.id, 'sink': name, 'attempts': 0}
+        for name, subscription in sinks.items()
+        for row in rows if subscription.matches(row.event_type, row.user_id)
+    ]
+    if deliveries:
+        db.session.execute(insert(OutboxDelivery), deliveries)
+    db.session.execute(
+        update(OutboxEvent).where(OutboxEvent.id.in_([row.id for row in rows])).values(dispatched_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    return len(rows)
+
+def deliver_batch(name, batch_size=BATCH_SIZE):
+    """Send the oldest events queued for sink name to it; returns how many were delivered.
+
+    Delivered events leave the sink's queue. If the sink fails they stay
+    queued, with their attempt count raised, and the error propagates.
+    """
+    rows = db.session.execute(
+        outbox_events_stmt().join(OutboxDelivery, OutboxDelivery.event_id == OutboxEvent.id)
+        .where(OutboxDelivery.sink == name).limit(batch_size)
+        .with_for_update(of=OutboxDelivery, skip_locked=True)
+    ).all()
+    if not rows:
+        db.session.rollback()
+        return 0
+    event_ids = [row.event_id for row in rows]
+    queued = (OutboxDelivery.sink == name) & OutboxDelivery.event_id.in_(event_ids)
+    try:
+        sinks[name].sink([event_payload(row) for row in rows])
+    except Exception:
+        db.session.rollback()
+        db.session.execute(
+            update(OutboxDelivery).where(queued).values(attempts=OutboxDelivery.attempts + 1),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        raise
+    db.session.execute(delete(OutboxDelivery).where(queued), execution_options={'synchronize_session': False})
+    db.session.commit()
+    return len(event_ids)
+
+def purge_dispatched(retention=RETENTION):
+    """Delete events dispatched longer ago than retention that every sink has accepted; returns how many were deleted"""
+    result = db.session.execute(delete(OutboxEvent).where(
+        OutboxEvent.dispatched_at.isnot(None),
+        OutboxEvent.dispatched_at < datetime.utcnow() - retention,
+        ~exists().where(OutboxDelivery.event_id == OutboxEvent.id)
+    ))
+    db.session.commit()
+    return result.rowcount
+
+def run_dispatcher(batch_size=BATCH_SIZE, poll_seconds=POLL_SECONDS, once=False):
+    """Queue and deliver until the outbox is drained, then poll.
+
+    Each failing sink is retried on its own exponential backoff while the
+    others carry on. With once, a failing sink is given up on for the run
+    and the error is raised after the others have been drained.
+    """
+    retry_at = {}  # sink name -> (monotonic time of the next attempt, backoff after that)
+    failed = []
+    next_purge = time.monotonic() + PURGE_SECONDS
+    while True:
+        try:
+            busy = queue_batch(batch_size) == batch_size
+        except Exception:
+            db.session.rollback()
+            if once:
+                raise
+            logging.exception(f"Outbox queueing failed, retrying in {poll_seconds}s")
+            time.sleep(poll_seconds)
+            continue
+        for name in list(sinks):
+            next_attempt, backoff = retry_at.get(name, (0, poll_seconds))
+            if name in failed or time.monotonic() < next_attempt:
+                continue
+            try:
+                delivered = deliver_batch(name, batch_size)
+            except Exception:
+                db.session.rollback()
+                if once:
+                    logging.exception(f"Webhook delivery to {name} failed")
+                    failed.append(name)
+                    continue
+                logging.exception(f"Webhook delivery to {name} failed, retrying in {backoff}s")
+                retry_at[name] = (time.monotonic() + backoff, min(backoff * 2, MAX_BACKOFF_SECONDS))
+                continue
+            retry_at.pop(name, None)
+            if delivered:
+                logging.info(f"Outbox delivered {delivered} events to {name}")
+                busy = busy or delivered == batch_size
+        if not busy or time.monotonic() >= next_purge:
+            try:
+                purge_dispatched()
+            except Exception:
+                db.session.rollback()
+                if once:
+                    raise
+                logging.exception("Outbox purge failed")
+            next_purge = time.monotonic() + PURGE_SECONDS
+        if busy:
+            continue
+        if once:
+            if failed:
+                raise RuntimeError(f"Webhook delivery failed for {', '.join(failed)}")
+            return
+        time.sleep(poll_seconds)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Deliver outbox events to partner webhooks')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--once', action='store_true', help='drain the outbox and exit')
+    args = parser.parse_args()
+    from app import app
+    with app.app_context():
+        register_env_sinks()
+        run_dispatcher(args.batch_size, once=args.once)
@@ -0,0 +1,78 @@
+from datetime import datetime
+from sqlalchemy import func, or_, select
+from models import User, Transaction, OutboxEvent, ServerSession
+
+# Statements shared by the Flask views and the async endpoints in asgi.py,
+# so both serving modes run exactly the same SQL.
+
+def recent_transactions_stmt(user_id, limit=5):
+    """Most recent transactions sent or received by a user"""
+    return select(Transaction).where(
+        or_(Transaction.from_user_id == user_id, Transaction.to_user_id == user_id)
+    ).order_by(Transaction.created_at.desc()).limit(limit)
+
+def referral_earnings_stmt(user_id):
+    """Total referral bonuses credited to a user"""
+    return select(func.sum(Transaction.amount)).where(
+        Transaction.to_user_id == user_id,
+        Transaction.transaction_type == 'referral_bonus'
+    )
+
+def account_holder_stmt(account_number):
+    """Username of the account holder for an account number"""
+    return select(User.username).where(User.account_number == account_number)
+
+def session_data_stmt(sid):
+    """Serialized data of a server-side session, unless it has expired"""
+    return select(ServerSession.data).where(
+        ServerSession.id == sid,
+        ServerSession.expires_at >= datetime.utcnow()
+    )
+
+def transaction_to_dict(transaction, user_id):
+    """JSON-friendly view of a transaction from one user's point of view"""
+    return {
+        'id': transaction.id,
+        'type': transaction.transaction_type,
+        'direction': 'out' if transaction.from_user_id == user_id else 'in',
+        'amount': transaction.amount,
+        'status': transaction.status,
+        'description': transaction.description,
+        'created_at': transaction.created_at.isoformat() if transaction.created_at else None,
+    }
+
+def dashboard_payload(user, recent_transactions, referral_earnings):
+    """Body of the dashboard_data JSON endpoint"""
+    return {
+        'success': True,
+        'balance': user.balance,
+        'referral_earnings': referral_earnings or 0,
+        'recent_transactions': [transaction_to_dict(t, user.id) for t in recent_transactions],
+    }
+
+def outbox_events_stmt():
+    """Outbox events joined with their transactions, in id order.
+
+    Selects plain columns rather than entities: the event stream reads these
+    in bulk inside a process holding thousands of connections, where building
+    ORM objects is dominated by garbage collection over the large heap. The
+    transaction columns keep their attribute names so a row can be passed to
+    transaction_to_dict.
+    """
+    return select(
+        OutboxEvent.id.label('event_id'), OutboxEvent.event_type, OutboxEvent.user_id, OutboxEvent.balance,
+        OutboxEvent.created_at.label('event_created_at'),
+        Transaction.id, Transaction.transaction_type, Transaction.from_user_id, Transaction.amount,
+        Transaction.status, Transaction.description, Transaction.created_at
+    ).join(Transaction, Transaction.id == OutboxEvent.transaction_id).order_by(OutboxEvent.id)
+
+def event_payload(row):
+    """JSON body of an outbox_events_stmt row, as pushed to dashboards and partner webhooks"""
+    return {
+        'id': row.event_id,
+        'type': row.event_type,
+        'user_id': row.user_id,
+        'balance': row.balance,
+        'transaction': transaction_to_dict(row, row.user_id),
+        'created_at': row.event_created_at.isoformat() if row.event_created_at else None,
+    }
@@ -0,0 +1,159 @@
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from functools import wraps
+from flask import request, session, jsonify, flash, redirect
+from sqlalchemy import delete, select, update, insert
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+class Limit:
+    """Token bucket settings: burst capacity and tokens refilled per second"""
+    __slots__ = ('capacity', 'refill_rate')
+
+    def __init__(self, capacity, per_seconds):
+        self.capacity = float(capacity)
+        self.refill_rate = capacity / per_seconds
+
+def _refill(tokens, updated_at, limit, now):
+    """Return the token count after refilling since updated_at"""
+    return min(limit.capacity, tokens + (now - updated_at) * limit.refill_rate)
+
+def _full_at(tokens, limit, now):
+    """When a bucket left with tokens will be full again; from then on it is the same as no bucket"""
+    return now + (limit.capacity - tokens) / limit.refill_rate
+
+class MemoryBackend:
+    """In-process token buckets, shared by the threads of one worker"""
+
+    # Eviction frees this fraction of max_keys so a flood of new keys does not sweep on every request
+    EVICT_HEADROOM = 0.1
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at, full_at), least recently used first
+        self._lock = threading.Lock()
+
+    def consume(self, key, limit, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._evict(now)
+                tokens = limit.capacity
+            else:
+                tokens = _refill(bucket[0], bucket[1], limit, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, _full_at(tokens, limit, now))
+            self._buckets.move_to_end(key)
+            return allowed
+
+    def _evict(self, now):
+        """Drop buckets that have fully refilled, then the least recently used ones"""
+        for key in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+        target = int(self.max_keys * (1 - self.EVICT_HEADROOM))
+        while len(self._buckets) > target:
+            self._buckets.popitem(last=False)
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+class DatabaseBackend:
+    """Token buckets in the RateLimitBucket table, shared by every worker and node.
+
+    Uses the application database, so SQLite stands in locally and Postgres
+    provides row locking in production. Each check runs in its own short
+    connection so it never touches the request's session. Buckets that have
+    fully refilled carry no state and are purged every PURGE_EVERY checks.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(self):
+        self._writes = 0
+
+    def consume(self, key, limit, now=None):
+        from models import RateLimitBucket
+        now = time.time() if now is None else now
+        table = RateLimitBucket.__table__
+        for _ in range(2):
+            try:
+                with db.engine.begin() as conn:
+                    row = conn.execute(
+                        select(table.c.tokens, table.c.updated_at).where(table.c.key == key).with_for_update()
+                    ).first()
+                    tokens = limit.capacity if row is None else _refill(row.tokens, row.updated_at, limit, now)
+                    allowed = tokens >= 1
+                    if allowed:
+                        tokens -= 1
+                    values = {'tokens': tokens, 'updated_at': now, 'full_at': _full_at(tokens, limit, now)}
+                    if row is None:
+                        conn.execute(insert(table).values(key=key, **values))
+                    else:
+                        conn.execute(update(table).where(table.c.key == key).values(**values))
+                break
+            except IntegrityError:
+                # Another worker created the bucket first; retry against its row
+                continue
+        else:
+            return True
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self.purge_refilled(now)
+        return allowed
+
+    def purge_refilled(self, now=None):
+        from models import RateLimitBucket
+        now = time.time() if now is None else now
+        with db.engine.begin() as conn:
+            conn.execute(delete(RateLimitBucket.__table__).where(RateLimitBucket.full_at <= now))
+
+    def reset(self):
+        from models import RateLimitBucket
+        with db.engine.begin() as conn:
+            conn.execute(RateLimitBucket.__table__.delete())
+
+_BACKENDS = {
+    'memory': MemoryBackend,
+    'database': DatabaseBackend,
+}
+
+backend = _BACKENDS[os.environ.get('RATE_LIMIT_BACKEND', 'memory')]()
+
+def client_ip():
+    """Client address; ProxyFix has already applied X-Forwarded-For"""
+    return request.remote_addr or 'unknown'
+
+def session_user_key():
+    return session.get('user_id')
+
+def _limited_response():
+    message = 'Too many requests. Please wait a moment and try again.'
+    if request.is_json:
+        return jsonify({'success': False, 'message': message}), 429
+    flash(message, 'error')
+    return redirect(request.url, code=303)
+
+def rate_limit(scope, per_ip=None, per_user=None, user_key=session_user_key, methods=('POST',)):
+    """Decorator to throttle a view with per-IP and per-user token buckets"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method in methods:
+                if per_ip and not backend.consume(f'{scope}:ip:{client_ip()}', per_ip):
+                    logging.warning(f"Rate limit hit for {scope} from {client_ip()}")
+                    return _limited_response()
+                key = user_key() if per_user else None
+                if key is not None and not backend.consume(f'{scope}:user:{key}', per_user):
+                    logging.warning(f"Rate limit hit for {scope} by user {key}")
+                    return _limited_response()
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
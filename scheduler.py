@@ -0,0 +1,207 @@
+"""Scheduled and recurring transfers (standing orders).
+
+Workers claim due schedules in batches with a short lease, so any number of
+nodes can run side by side without executing a schedule twice, then post
+the whole batch through ledger.post_transfers in one transaction.
+
+Run with: python scheduler.py [--node NAME] [--batch-size N] [--once]
+"""
+import argparse
+import calendar
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, func, insert, or_, select, update
+from app import db
+from models import User, Transaction, ScheduledTransfer
+from ledger import post_transfers
+
+INTERVALS = ('daily', 'weekly', 'monthly')
+BATCH_SIZE = 5000
+LEASE_SECONDS = 120
+POLL_SECONDS = 30
+
+def add_interval(when, interval):
+    """The next occurrence of a schedule after when"""
+    if interval == 'daily':
+        return when + timedelta(days=1)
+    if interval == 'weekly':
+        return when + timedelta(weeks=1)
+    if interval == 'monthly':
+        year, month = (when.year + 1, 1) if when.month == 12 else (when.year, when.month + 1)
+        return when.replace(year=year, month=month, day=min(when.day, calendar.monthrange(year, month)[1]))
+    raise ValueError(f'Unknown schedule interval: {interval}')
+
+def next_run_after(scheduled_at, interval, now):
+    """Advance past now, so a schedule missed while workers were down runs once, not once per missed period"""
+    next_run = add_interval(scheduled_at, interval)
+    while next_run <= now:
+        next_run = add_interval(next_run, interval)
+    return next_run
+
+def start_approved_standing_orders(transaction_ids, now=None):
+    """Create the standing orders requested on held transfers among transaction_ids that have been approved.
+
+    The approved transfer is the first payment, as for an OTP-confirmed one.
+    The caller commits. Returns how many standing orders were created.
+    """
+    if not transaction_ids:
+        return 0
+    now = now or datetime.utcnow()
+    transfers = db.session.execute(
+        select(Transaction.from_user_id, Transaction.to_user_id, Transaction.amount, Transaction.description,
+               Transaction.repeat_interval, User.username)
+        .join(User, User.id == Transaction.to_user_id).where(
+            Transaction.id.in_(transaction_ids),
+            Transaction.status == 'completed',
+            Transaction.repeat_interval.isnot(None)
+        )
+    ).all()
+    if transfers:
+        db.session.execute(insert(ScheduledTransfer), [{
+            'user_id': t.from_user_id,
+            'to_user_id': t.to_user_id,
+            'amount': t.amount,
+            'description': f"Standing order to {t.username}: {(t.description or '').removeprefix(f'Transfer to {t.username}: ')}",
+            'interval': t.repeat_interval,
+            'next_run_at': add_interval(now, t.repeat_interval),
+        } for t in transfers])
+    return len(transfers)
+
+def claim_due(node_id, batch_size=BATCH_SIZE, now=None, lease_seconds=LEASE_SECONDS):
+    """Lease up to batch_size due schedules to node_id; returns them, earliest first, with the lease expiry.
+
+    On Postgres the candidate rows are picked with FOR UPDATE SKIP LOCKED so
+    concurrent workers never wait on or take each other's rows; on SQLite the
+    single UPDATE statement is atomic on its own. Expired leases (a worker
+    that died mid-batch) are reclaimed.
+    """
+    now = now or datetime.utcnow()
+    lease_until = now + timedelta(seconds=lease_seconds)
+    table = ScheduledTransfer.__table__
+    due = select(table.c.id).where(
+        table.c.is_active.is_(True),
+        table.c.next_run_at <= now,
+        or_(table.c.claimed_until.is_(None), table.c.claimed_until < now)
+    ).order_by(table.c.next_run_at).limit(batch_size).with_for_update(skip_locked=True)
+    db.session.execute(
+        update(table).where(table.c.id.in_(due.scalar_subquery())).values(claimed_by=node_id, claimed_until=lease_until),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    return ScheduledTransfer.query.filter_by(
+        claimed_by=node_id, claimed_until=lease_until
+    ).order_by(ScheduledTransfer.next_run_at).all(), lease_until
+
+def execute_claimed(schedules, node_id, lease_until, now=None):
+    """Post one transfer per claimed schedule in a single transaction and advance the schedules.
+
+    Returns a (completed, failed) count tuple.
+    """
+    now = now or datetime.utcnow()
+    table = ScheduledTransfer.__table__
+    # Lock our claims; any whose lease expired and was taken over, or that were
+    # cancelled since they were claimed, are dropped
+    still_ours = set(db.session.scalars(select(table.c.id).where(
+        table.c.id.in_([s.id for s in schedules]),
+        table.c.claimed_by == node_id,
+        table.c.claimed_until == lease_until,
+        table.c.is_active.is_(True)
+    ).with_for_update()))
+    schedules = [s for s in schedules if s.id in still_ours]
+    if not schedules:
+        db.session.rollback()
+        return 0, 0
+
+    # Plain rows, since post_transfers expires the session's objects
+    claimed = [(s.id, s.user_id, s.to_user_id, s.amount, s.description, s.interval, s.next_run_at) for s in schedules]
+    suspended = set(db.session.scalars(select(User.id).where(
+        User.id.in_({row[1] for row in claimed}),
+        User.is_suspended.is_(True)
+    )))
+    runnable = [row for row in claimed if row[1] not in suspended]
+
+    transaction_ids = db.session.scalars(
+        insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+        [{
+            'from_user_id': user_id,
+            'to_user_id': to_user_id,
+            'amount': amount,
+            'transaction_type': 'transfer',
+            'status': 'pending',
+            'description': description,
+            'created_at': now,
+        } for _, user_id, to_user_id, amount, description, _, _ in runnable]
+    ).all() if runnable else []
+    completed_ids, _ = post_transfers(transaction_ids)
+    completed_ids = set(completed_ids)
+    transaction_for = {row[0]: t for row, t in zip(runnable, transaction_ids)}
+
+    db.session.execute(
+        update(table).where(table.c.id == bindparam('sid')).values(
+            next_run_at=bindparam('next_run'),
+            last_run_at=now,
+            last_status=bindparam('status'),
+            last_transaction_id=bindparam('transaction_id'),
+            run_count=table.c.run_count + 1,
+            claimed_by=None,
+            claimed_until=None
+        ),
+        [{
+            'sid': sid,
+            'next_run': next_run_after(next_run_at, interval, now),
+            'status': 'completed' if transaction_for.get(sid) in completed_ids else 'failed',
+            'transaction_id': transaction_for.get(sid),
+        } for sid, _, _, _, _, interval, next_run_at in claimed]
+    )
+    db.session.commit()
+    db.session.expire_all()
+    return len(completed_ids), len(claimed) - len(completed_ids)
+
+def run_once(node_id, batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS):
+    """Execute every schedule that is due now; returns (completed, failed) totals"""
+    totals = [0, 0]
+    while True:
+        schedules, lease_until = claim_due(node_id, batch_size, lease_seconds=lease_seconds)
+        if not schedules:
+            return tuple(totals)
+        completed, failed = execute_claimed(schedules, node_id, lease_until)
+        totals[0] += completed
+        totals[1] += failed
+        logging.info(f"Scheduler {node_id}: {completed} scheduled transfers completed, {failed} failed")
+
+def run_worker(node_id, batch_size=BATCH_SIZE, poll_seconds=POLL_SECONDS):
+    """Run due schedules forever, sleeping until the next one is due.
+
+    A failed iteration is logged and retried after poll_seconds; claims it
+    left behind expire with their lease, so nothing runs twice.
+    """
+    while True:
+        try:
+            run_once(node_id, batch_size)
+            next_due = db.session.scalar(
+                select(func.min(ScheduledTransfer.next_run_at)).where(ScheduledTransfer.is_active.is_(True))
+            )
+            db.session.rollback()
+        except Exception:
+            db.session.rollback()
+            logging.exception(f"Scheduler {node_id} failed, retrying in {poll_seconds}s")
+            time.sleep(poll_seconds)
+            continue
+        wait = poll_seconds if next_due is None else (next_due - datetime.utcnow()).total_seconds()
+        time.sleep(min(max(wait, 0.1), poll_seconds))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Execute scheduled transfers')
+    parser.add_argument('--node', default=f'{socket.gethostname()}:{os.getpid()}')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--once', action='store_true', help='run what is due now and exit')
+    args = parser.parse_args()
+    from app import app
+    with app.app_context():
+        if args.once:
+            run_once(args.node, args.batch_size)
+        else:
+            run_worker(args.node, args.batch_size)
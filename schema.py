@@ -0,0 +1,88 @@
+"""In-place upgrades for databases created by an earlier version of the app.
+
+db.create_all() creates missing tables but never alters existing ones, so
+every column added to an existing model is listed in ADDED_COLUMNS. At
+startup upgrade_schema() adds the ones the database lacks, with their
+indexes, and runs each column's backfill in the same transaction as the
+ALTER TABLE. Columns that already exist are skipped, so it is safe to run
+on every start and from several processes at once.
+"""
+import logging
+from sqlalchemy import bindparam, inspect, literal, select, text, update
+from sqlalchemy.exc import DBAPIError
+from app import db
+from models import User, Transaction
+from utils import is_suspicious_activity, recent_transaction_counts, transaction_risk_score
+
+def flag_held_transfers():
+    """Mark the pending transfers held by is_suspicious_activity before is_flagged existed.
+
+    The hold decision is replayed as of when each transfer was made, so
+    transfers still waiting for their sender's OTP stay out of the review queue.
+    """
+    pending = db.session.execute(
+        select(Transaction.id, Transaction.from_user_id, Transaction.amount, Transaction.created_at).where(
+            Transaction.status == 'pending',
+            Transaction.transaction_type == 'transfer'
+        )
+    ).all()
+    recent = recent_transaction_counts((t.id, t.from_user_id, t.created_at) for t in pending)
+    held = [
+        {'tid': t.id, 'score': transaction_risk_score(t.amount, recent.get(t.id, 0))}
+        for t in pending if is_suspicious_activity(None, t.amount, 'transfer', recent.get(t.id, 0))
+    ]
+    if held:
+        transaction_table = Transaction.__table__
+        db.session.execute(
+            update(transaction_table).where(transaction_table.c.id == bindparam('tid'))
+            .values(is_flagged=True, risk_score=bindparam('score')),
+            held
+        )
+    logging.info(f"Schema upgrade flagged {len(held)} pending transfers for review")
+
+# (column, backfill run once when the column is added), in the order they were introduced
+ADDED_COLUMNS = [
+    (Transaction.__table__.c.risk_score, None),
+    (Transaction.__table__.c.is_flagged, flag_held_transfers),
+    (User.__table__.c.risk_score, None),
+    (Transaction.__table__.c.repeat_interval, None),
+]
+
+def _has_column(column):
+    return column.name in {c['name'] for c in inspect(db.engine).get_columns(column.table.name)}
+
+def _add_column_ddl(column, dialect):
+    preparer = dialect.identifier_preparer
+    ddl = f'ALTER TABLE {preparer.format_table(column.table)} ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=dialect)}'
+    if column.default is not None and column.default.is_scalar:
+        default = literal(column.default.arg, column.type).compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+        ddl += f' DEFAULT {default}'
+    return ddl
+
+def upgrade_schema():
+    """Add any ADDED_COLUMNS the database is missing; returns the names of the columns added"""
+    added = []
+    for column, backfill in ADDED_COLUMNS:
+        if _has_column(column):
+            continue
+        try:
+            if db.engine.dialect.name == 'sqlite':
+                # pysqlite does not begin a transaction for DDL, so the column
+                # would be committed even if its backfill failed
+                db.session.execute(text('BEGIN'))
+            db.session.execute(text(_add_column_ddl(column, db.engine.dialect)))
+            for index in column.table.indexes:
+                if column.name in index.columns:
+                    index.create(db.session.connection(), checkfirst=True)
+            if backfill is not None:
+                backfill()
+            db.session.commit()
+        except DBAPIError:
+            db.session.rollback()
+            # Another process starting at the same time added it first
+            if _has_column(column):
+                continue
+            raise
+        added.append(f'{column.table.name}.{column.name}')
+        logging.info(f"Schema upgrade added {column.table.name}.{column.name}")
+    return added
@@ -0,0 +1,173 @@
+import os
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import delete, insert, update
+from werkzeug.datastructures import CallbackDict
+from app import db
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session data kept on the server; the cookie only carries the signed id"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        """Move the data to a fresh id, e.g. on login, so a planted id cannot be reused"""
+        if self.previous_sid is None and not self.new:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+class MemorySessionStore:
+    """Per-process LRU session store, for development and single-worker deployments"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if expires_at < datetime.utcnow():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return data
+
+    def set(self, sid, data, expires_at):
+        with self._lock:
+            self._entries[sid] = (data, expires_at)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+class SqlSessionStore:
+    """Session store in the ServerSession table, shared by every worker.
+
+    Reads and writes use their own short connection so saving a session never
+    commits or rolls back the request's ORM session.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(self):
+        self._writes = 0
+
+    @property
+    def table(self):
+        from models import ServerSession
+        return ServerSession.__table__
+
+    def get(self, sid):
+        from queries import session_data_stmt
+        with db.engine.connect() as conn:
+            return conn.scalar(session_data_stmt(sid))
+
+    def set(self, sid, data, expires_at):
+        table = self.table
+        with db.engine.begin() as conn:
+            result = conn.execute(update(table).where(table.c.id == sid).values(data=data, expires_at=expires_at))
+            if result.rowcount == 0:
+                conn.execute(insert(table).values(id=sid, data=data, expires_at=expires_at))
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self.purge_expired()
+
+    def delete(self, sid):
+        with db.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.id == sid))
+
+    def purge_expired(self):
+        with db.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.expires_at < datetime.utcnow()))
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface backed by a MemorySessionStore or SqlSessionStore"""
+
+    salt = 'swiftpay-session'
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def session_id_from_cookie(self, app, signed_sid):
+        """Verify a session cookie value and return the session id, or None"""
+        if not signed_sid:
+            return None
+        try:
+            return self._signer(app).unsign(signed_sid).decode()
+        except BadSignature:
+            return None
+
+    def open_session(self, app, request):
+        sid = self.session_id_from_cookie(app, request.cookies.get(self.get_cookie_name(app)))
+        if sid:
+            data = self.store.get(sid)
+            if data is not None:
+                return ServerSideSession(self.serializer.loads(data), sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.previous_sid:
+            self.store.delete(session.previous_sid)
+
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.modified:
+            expires_at = datetime.utcnow() + app.permanent_session_lifetime
+            self.store.set(session.sid, self.serializer.dumps(dict(session)), expires_at)
+        elif not self.should_set_cookie(app, session):
+            return
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+_STORES = {
+    'memory': MemorySessionStore,
+    'sql': SqlSessionStore,
+}
+
+def init_sessions(app):
+    """Install server-side sessions using the store named by SESSION_BACKEND"""
+    app.session_interface = ServerSideSessionInterface(_STORES[os.environ.get('SESSION_BACKEND', 'sql')]())
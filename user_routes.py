@@ -1,7 +1,13 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, g
 from app import db
-from models import User, Transaction, OTP
-from utils import format_currency, validate_account_number, is_suspicious_activity
+from models import User, Transaction, OTP, ScheduledTransfer
+from rate_limit import rate_limit, Limit
+from db_routing import read_replica
+from scheduler import INTERVALS, add_interval
+from ledger import post_transfers
+from outbox import record_completed
+from queries import recent_transactions_stmt, referral_earnings_stmt, account_holder_stmt, dashboard_payload
+from utils import format_currency, validate_account_number, is_suspicious_activity, transaction_risk_score, recent_transaction_count
 from datetime import datetime, timedelta
 import logging
 import random
@@ -9,16 +15,27 @@ import string
 
 user_bp = Blueprint('user', __name__)
 
+VERIFY_ACCOUNT_LIMITS = {'per_ip': Limit(60, per_seconds=60), 'per_user': Limit(30, per_seconds=60)}
+
 def generate_otp():
     """Generate a 6-digit OTP"""
     return ''.join(random.choices(string.digits, k=6))
 
 def require_login(f):
-    """Decorator to require user login"""
+    """Decorator to require user login and load the user into g.user once per request"""
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             flash('Please login to access this page', 'error')
             return redirect(url_for('auth.login'))
+        if 'user' not in g:
+            g.user = db.session.get(User, session['user_id'])
+        if not g.user:
+            session.clear()
+            return redirect(url_for('auth.login'))
+        if g.user.is_suspended:
+            session.clear()
+            flash('Your account has been suspended. Please contact support.', 'error')
+            return redirect(url_for('auth.login'))
         return f(*args, **kwargs)
     decorated_function.__name__ = f.__name__
     return decorated_function
@@ -26,21 +43,13 @@ def require_login(f):
 @user_bp.route('/dashboard')
 @require_login
 def dashboard():
-    user = User.query.get(session['user_id'])
-    if not user:
-        session.clear()
-        return redirect(url_for('auth.login'))
+    user = g.user
     
     # Get recent transactions
-    recent_transactions = Transaction.query.filter(
-        (Transaction.from_user_id == user.id) | (Transaction.to_user_id == user.id)
-    ).order_by(Transaction.created_at.desc()).limit(5).all()
+    recent_transactions = db.session.scalars(recent_transactions_stmt(user.id)).all()
     
     # Calculate referral earnings
-    referral_earnings = db.session.query(db.func.sum(Transaction.amount)).filter(
-        Transaction.to_user_id == user.id,
-        Transaction.transaction_type == 'referral_bonus'
-    ).scalar() or 0
+    referral_earnings = db.session.scalar(referral_earnings_stmt(user.id)) or 0
     
     return render_template('user/dashboard.html', 
                          user=user, 
@@ -48,16 +57,36 @@ def dashboard():
                          referral_earnings=referral_earnings,
                          format_currency=format_currency)
 
+@user_bp.route('/dashboard_data')
+@require_login
+def dashboard_data():
+    user = g.user
+    recent_transactions = db.session.scalars(recent_transactions_stmt(user.id)).all()
+    referral_earnings = db.session.scalar(referral_earnings_stmt(user.id))
+    return jsonify(dashboard_payload(user, recent_transactions, referral_earnings))
+
+@user_bp.route('/events')
+@require_login
+def events():
+    # Live updates are streamed by asgi.py; a sync worker cannot hold the
+    # connection open, so tell EventSource not to reconnect (204 ends it)
+    return '', 204
+
 @user_bp.route('/transfer', methods=['GET', 'POST'])
 @require_login
 def transfer():
     if request.method == 'POST':
-        user = User.query.get(session['user_id'])
+        user = g.user
         account_number = request.form.get('account_number')
         amount = float(request.form.get('amount', 0))
         description = request.form.get('description', '')
+        repeat = request.form.get('repeat', '')
         
         # Validation
+        if repeat and repeat not in INTERVALS:
+            flash('Invalid repeat option', 'error')
+            return render_template('user/transfer.html', user=user, format_currency=format_currency)
+        
         if not validate_account_number(account_number):
             flash('Invalid account number format', 'error')
             return render_template('user/transfer.html', user=user, format_currency=format_currency)
@@ -81,8 +110,11 @@ def transfer():
             return render_template('user/transfer.html', user=user, format_currency=format_currency)
         
         # Check for suspicious activity
-        if is_suspicious_activity(user, amount, 'transfer'):
+        recent_transactions = recent_transaction_count(user.id)
+        if is_suspicious_activity(user, amount, 'transfer', recent_transactions):
             flash('Transaction flagged for review. Please contact support.', 'warning')
+            if repeat:
+                flash(f'Your {repeat} standing order will start once this transfer is approved.', 'info')
             # Create pending transaction
             transaction = Transaction()
             transaction.from_user_id = user.id
@@ -91,6 +123,9 @@ def transfer():
             transaction.transaction_type = 'transfer'
             transaction.status = 'pending'
             transaction.description = f'Transfer to {recipient.username}: {description}'
+            transaction.risk_score = transaction_risk_score(amount, recent_transactions)
+            transaction.is_flagged = True
+            transaction.repeat_interval = repeat or None
             db.session.add(transaction)
             db.session.commit()
             return render_template('user/transfer.html', user=user, format_currency=format_currency)
@@ -129,7 +164,8 @@ def transfer():
             'recipient_name': recipient.username,
             'amount': amount,
             'account_number': account_number,
-            'description': description
+            'description': description,
+            'repeat': repeat
         }
         
         # In a real app, send OTP via SMS here
@@ -139,20 +175,20 @@ def transfer():
         flash(f'OTP sent successfully! Check your phone for the verification code.', 'info')
         return redirect(url_for('user.verify_transfer_otp'))
     
-    user = User.query.get(session['user_id'])
+    user = g.user
     return render_template('user/transfer.html', user=user, format_currency=format_currency)
 
 @user_bp.route('/add_funds')
 @require_login
 def add_funds():
-    user = User.query.get(session['user_id'])
+    user = g.user
     return render_template('user/add_funds.html', user=user)
 
 @user_bp.route('/withdraw', methods=['GET', 'POST'])
 @require_login
 def withdraw():
     if request.method == 'POST':
-        user = User.query.get(session['user_id'])
+        user = g.user
         amount = float(request.form.get('amount', 0))
         bank_account = request.form.get('bank_account')
         
@@ -180,6 +216,8 @@ def withdraw():
         transaction.status = 'completed'
         transaction.description = f'Withdrawal to bank account {bank_account}'
         db.session.add(transaction)
+        db.session.flush()
+        record_completed([transaction.id])
         db.session.commit()
         
         flash(f'Successfully withdrew {format_currency(amount)} to your bank account', 'success')
@@ -189,8 +227,9 @@ def withdraw():
 
 @user_bp.route('/transactions')
 @require_login
+@read_replica
 def transactions():
-    user = User.query.get(session['user_id'])
+    user = g.user
     page = request.args.get('page', 1, type=int)
     
     transactions = Transaction.query.filter(
@@ -206,6 +245,7 @@ def transactions():
 
 @user_bp.route('/verify_account', methods=['POST'])
 @require_login
+@rate_limit('verify_account', **VERIFY_ACCOUNT_LIMITS)
 def verify_account():
     data = request.get_json()
     account_number = data.get('account_number')
@@ -213,14 +253,15 @@ def verify_account():
     if not account_number or not validate_account_number(account_number):
         return jsonify({'success': False, 'message': 'Invalid account number'})
     
-    user = User.query.filter_by(account_number=account_number).first()
-    if user:
-        return jsonify({'success': True, 'account_holder': user.username})
+    account_holder = db.session.scalar(account_holder_stmt(account_number))
+    if account_holder:
+        return jsonify({'success': True, 'account_holder': account_holder})
     else:
         return jsonify({'success': False, 'message': 'Account not found'})
 
 @user_bp.route('/verify_transfer_otp', methods=['GET', 'POST'])
 @require_login
+@rate_limit('verify_otp', per_ip=Limit(30, per_seconds=60), per_user=Limit(5, per_seconds=60))
 def verify_transfer_otp():
     if 'pending_transfer' not in session:
         flash('No pending transfer found. Please start a new transfer.', 'error')
@@ -247,52 +288,54 @@ def verify_transfer_otp():
         # Mark OTP as used
         otp.is_used = True
         
-        # Get transaction and complete it
-        transaction = Transaction.query.get(transfer_data['transaction_id'])
-        if not transaction:
-            flash('Transaction not found. Please contact support.', 'error')
-            return redirect(url_for('user.dashboard'))
-        
-        # Get users
-        sender = User.query.get(transaction.from_user_id)
-        recipient = User.query.get(transaction.to_user_id)
-        
-        # Verify sender still has sufficient balance
-        if sender.balance < transaction.amount:
-            transaction.status = 'failed'
-            transaction.description += ' (Insufficient funds at completion)'
+        # Post through the ledger, which locks the transfer and only moves money if it is still pending
+        completed_ids, failed_ids = post_transfers([transfer_data['transaction_id']])
+        session.pop('pending_transfer', None)
+        if not completed_ids:
             db.session.commit()
-            flash('Transfer failed: Insufficient balance. Please try again.', 'error')
-            session.pop('pending_transfer', None)
+            if failed_ids:
+                flash('Transfer failed: Insufficient balance. Please try again.', 'error')
+            else:
+                flash('This transfer has already been processed.', 'error')
             return redirect(url_for('user.dashboard'))
         
-        # Complete the transfer
-        sender.balance -= transaction.amount
-        recipient.balance += transaction.amount
-        transaction.status = 'completed'
+        transaction = db.session.get(Transaction, completed_ids[0])
+        recipient = transaction.receiver
         
-        db.session.commit()
+        # Set up the standing order; the first payment is the one just confirmed
+        repeat = transfer_data.get('repeat')
+        if repeat:
+            schedule = ScheduledTransfer()
+            schedule.user_id = transaction.from_user_id
+            schedule.to_user_id = recipient.id
+            schedule.amount = transaction.amount
+            schedule.description = f'Standing order to {recipient.username}: {transfer_data["description"]}'
+            schedule.interval = repeat
+            schedule.next_run_at = add_interval(datetime.utcnow(), repeat)
+            db.session.add(schedule)
         
-        # Clear pending transfer from session
-        session.pop('pending_transfer', None)
+        db.session.commit()
         
         flash(f'Transfer completed successfully! {format_currency(transaction.amount)} sent to {recipient.username}', 'success')
+        if repeat:
+            flash(f'Standing order created: {format_currency(transaction.amount)} to {recipient.username} {repeat}', 'info')
         return redirect(url_for('user.dashboard'))
     
     # GET request - show OTP verification form
-    transfer_data = session['pending_transfer']
-    transfer_data['user'] = User.query.get(session['user_id'])
+    transfer_data = dict(session['pending_transfer'])
+    transfer_data['user'] = g.user
     transfer_data['transfer_id'] = transfer_data['otp_id']  # For the form
     
     return render_template('user/transfer_otp.html', **transfer_data, format_currency=format_currency)
 
 @user_bp.route('/resend_otp', methods=['POST'])
 @require_login
+@rate_limit('resend_otp', per_ip=Limit(10, per_seconds=60), per_user=Limit(3, per_seconds=60))
 def resend_otp():
     if 'pending_transfer' not in session:
         return jsonify({'success': False, 'message': 'No pending transfer found'})
     
-    user = User.query.get(session['user_id'])
+    user = g.user
     transfer_data = session['pending_transfer']
     
     # Delete old OTP
@@ -316,8 +359,32 @@ def resend_otp():
     
     # Update session with new OTP ID
     session['pending_transfer']['otp_id'] = otp.id
+    session.modified = True
     
     # Log the new OTP (in real app, send via SMS)
     logging.info(f"Resent Transfer OTP for user {user.username}: {otp_code}")
     
     return jsonify({'success': True, 'message': 'OTP resent successfully'})
+
+@user_bp.route('/schedules')
+@require_login
+def schedules():
+    user = g.user
+    standing_orders = ScheduledTransfer.query.filter_by(
+        user_id=user.id, is_active=True
+    ).order_by(ScheduledTransfer.next_run_at).all()
+    
+    return render_template('user/schedules.html',
+                         user=user,
+                         schedules=standing_orders,
+                         format_currency=format_currency)
+
+@user_bp.route('/schedules/<int:schedule_id>/cancel', methods=['POST'])
+@require_login
+def cancel_schedule(schedule_id):
+    schedule = ScheduledTransfer.query.filter_by(id=schedule_id, user_id=g.user.id).first_or_404()
+    schedule.is_active = False
+    db.session.commit()
+    
+    flash('Standing order cancelled', 'success')
+    return redirect(url_for('user.schedules'))
@@ -1,6 +1,8 @@
 import random
 import string
-from datetime import datetime
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
 
 def generate_account_number():
     """Generate a unique 10-digit account number"""
@@ -14,23 +16,68 @@ def format_currency(amount):
     """Format amount as Nigerian Naira"""
     return f"₦{amount:,.2f}"
 
-def is_suspicious_activity(user, amount, transaction_type):
-    """Simple fraud detection - flag large transactions or frequent transactions"""
+# Window counted by the frequent-transactions check
+RECENT_WINDOW = timedelta(hours=1)
+
+def recent_transaction_count(user_id, before=None):
+    """Number of transactions sent or received by a user in the hour before `before` (default now)"""
+    from models import Transaction
+    before = before or datetime.utcnow()
+    return Transaction.query.filter(
+        (Transaction.from_user_id == user_id) | (Transaction.to_user_id == user_id),
+        Transaction.created_at >= before - RECENT_WINDOW,
+        Transaction.created_at < before
+    ).count()
+
+def recent_transaction_counts(transfers):
+    """recent_transaction_count for many (key, user_id, before) triples in one query; returns {key: count}"""
+    from models import Transaction
+    transfers = [t for t in transfers if t[2] is not None]
+    if not transfers:
+        return {}
+    user_ids = {user_id for _, user_id, _ in transfers}
+    rows = Transaction.query.with_entities(
+        Transaction.from_user_id, Transaction.to_user_id, Transaction.created_at
+    ).filter(
+        Transaction.from_user_id.in_(user_ids) | Transaction.to_user_id.in_(user_ids),
+        Transaction.created_at >= min(before for _, _, before in transfers) - RECENT_WINDOW,
+        Transaction.created_at < max(before for _, _, before in transfers)
+    ).all()
+    times = defaultdict(list)
+    for from_user_id, to_user_id, created_at in rows:
+        for user_id in {from_user_id, to_user_id} & user_ids:
+            times[user_id].append(created_at)
+    for user_times in times.values():
+        user_times.sort()
+    return {
+        key: bisect_left(times[user_id], before) - bisect_left(times[user_id], before - RECENT_WINDOW)
+        for key, user_id, before in transfers
+    }
+
+def is_suspicious_activity(user, amount, transaction_type, recent_transactions=None):
+    """Simple fraud detection - flag large transactions or frequent transactions.
+
+    recent_transactions is the user's recent_transaction_count, when the caller already has it.
+    """
     if amount > 100000:  # Large transaction
         return True
     
     # Check for frequent transactions in the last hour
-    from models import Transaction
-    recent_transactions = Transaction.query.filter(
-        (Transaction.from_user_id == user.id) | (Transaction.to_user_id == user.id),
-        Transaction.created_at >= datetime.utcnow().replace(hour=datetime.utcnow().hour - 1)
-    ).count()
+    if recent_transactions is None:
+        recent_transactions = recent_transaction_count(user.id)
     
     if recent_transactions > 10:  # More than 10 transactions in an hour
         return True
     
     return False
 
+def transaction_risk_score(amount, recent_transactions):
+    """Score a flagged transaction for the admin review queue (higher is riskier).
+
+    recent_transactions is the sender's recent_transaction_count when the transfer was made.
+    """
+    return round(amount / 100000 + recent_transactions / 10, 4)
+
 def validate_account_number(account_number):
     """Validate account number format"""
     if not account_number or len(account_number) != 10: